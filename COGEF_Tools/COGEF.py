@@ -2,7 +2,9 @@ import os
 import sys
 import numpy as np
 import pandas as pd
+import matplotlib.pyplot as plt
 from os.path import exists
+from concurrent.futures import ThreadPoolExecutor
 from molSimplify.Classes.mol3D import mol3D
 from molSimplify.Classes.ligand import ligand_breakdown
 
@@ -16,9 +18,10 @@ def count_steps(filepath):
     #Analyze number of steps a COGEF run had proceeded
     #Return 0 as well if no file was found
     #Tip: we count 0A optimization as 1st step as well, so 10A stretching would be 51 steps
+    #dependency: open_output (General/io_tools.py)
     
     try:
-        file = open(filepath,'r')
+        file = open_output(filepath,'r')
     except:
         return 0
     lines = file.readlines()
@@ -60,48 +63,37 @@ def distance_from_xyz(lines,atom1,atom2,frontlines=2):
 
 
 
-def analyze_scan_optim(filepath,no_mol2 = False): 
+#Version of the results of analyze_scan_optim kept in parse caches: bump it when their shape changes
+SCAN_OPTIM_VERSION = 1
+
+
+
+def analyze_scan_optim(filepath,no_mol2 = False, cache = None): 
     
     #Read a scan_optim output file of a COGEF run
     #Returns list of distance, list of energy, list of mol2
+    #cache: parse cache file, to reuse the result as long as the file has not changed
+    #dependency: read_xyz_frames, find_output (General/io_tools.py), mol2_from_arrays (General/tools.py),
+    #cached_call (General/parse_cache.py)
     
-    file = open(filepath, 'r')
-    lines = file.readlines()
+    if cache != None: #stamp the file actually read, which may be archived
+        return cached_call(find_output(filepath), analyze_scan_optim, (filepath, no_mol2), cachepath=cache,
+                           version=SCAN_OPTIM_VERSION)
+
+    symbols, coords, metas = read_xyz_frames(filepath)
     
     #Find Energies and Distances
     energies, distances = [],[]
-    for line in lines:
-        if 'Converged' in line:
-            energies.append(float(line.split()[4]))
-            distance = line.split()[6]
-            distance = distance.replace('(','')
-            distance = distance.replace(')','')
-            distances.append(float(distance))
-    
-    
-    #Count number of atoms of molecule
-    num_atoms = lines[0].split()[0]
-    num_atoms = int(num_atoms)
-    
-    #Count number of frames
-    #Each frame num lines: num_atoms + 2 header
-    num_lines = num_atoms+2
-    num_frames = len(lines)/(num_lines)
-    num_frames = int(num_frames)
+    for meta in metas:
+        if 'Converged' in meta['comment']:
+            energies.append(meta['energy'])
+            distances.append(meta['distance'])
     
     #Storing mol2s
     if no_mol2 == False:
         mol2s = []
-        for i in np.arange(num_frames):
-            first_line = i * num_lines
-            last_line = first_line + (num_atoms + 2) - 1 #Each xyz has num_atoms+2 lines
-            lines_output = lines_output = lines[first_line:last_line+1]
-            file2 = open('temp.xyz', 'w')
-            file2.writelines(lines_output)
-            file2.close()
-            moltemp = mol3D()
-            moltemp.readfromxyz('temp.xyz')
-            mol2 = moltemp.writemol2('temp.mol',writestring = True)
+        for frame in coords:
+            mol2 = mol2_from_arrays(symbols, frame)
             mol2s.append(mol2)
     
     if no_mol2 == False:
@@ -111,12 +103,11 @@ def analyze_scan_optim(filepath,no_mol2 = False):
   
   
   
-  def has_dissociated(mol2):
+def has_dissociated(mol2):
     
     #Reads a mol2 String and determine if it has dissociated
-    molecule = mol3D()
-    molecule.readfrommol2(mol2,readstring=True)
-    idxs,dents,coords = ligand_breakdown(molecule)
+    #dependency: geometry_state (General/structure_tools.py)
+    dents = geometry_state(mol2)['denticity']
     if dents == [3,3]:
         return False
     else:
@@ -129,7 +120,7 @@ def calculate_force(Es,dist=0.2):
     #Reads an scan_optim energy list and calculate the cogef force
     #dist: stretching distance
     
-    Erels = (np.array(Es) + Es[0]) * 2625.5 #in kJ
+    Erels = (np.array(Es) - Es[0]) * 2625.5 #in kJ, relative to the unstretched structure
     Fs = []
     for i in 1 + np.arange(len(Erels) - 1):
         F = (Erels[i] - Erels[i-1]) / dist #in kJ/A
@@ -139,155 +130,703 @@ def calculate_force(Es,dist=0.2):
 
 
 
-def coord_number_analysis(filepath,threshold=1.5):
+def load_scan_series(filepaths,cache=None):
+    
+    #Load the distance and energy series of many COGEF scans into padded arrays
+    #Scans have different numbers of steps: shorter ones are padded with NaN
+    #Inputs:
+    #filepaths: list of paths to scan_optim.xyz (missing or empty scans give all-NaN rows)
+    #cache: parse cache file, see analyze_scan_optim
+    #Outputs:
+    #distances, energies: (num_scans, max_steps) arrays (A, Hartree); nsteps: number of steps of each scan
+    #dependency: analyze_scan_optim, find_output (General/io_tools.py)
+    
+    series = []
+    for filepath in filepaths:
+        if exists(find_output(filepath)) == False:
+            series.append(([], []))
+        else:
+            series.append(analyze_scan_optim(filepath, no_mol2=True, cache=cache))
+    
+    nsteps = np.array([len(energies) for distances, energies in series], dtype=int)
+    distances = np.full((len(series), max(nsteps.max(initial=0), 2)), np.nan)
+    energies = np.full(distances.shape, np.nan)
+    for i, (ds, es) in enumerate(series):
+        distances[i, :len(ds)] = ds
+        energies[i, :len(es)] = es
+    
+    return distances, energies, nsteps
+
+
+
+def cogef_forces(distances,energies,smooth=1):
+    
+    #Force-extension curves of many COGEF scans at once (padded arrays from load_scan_series)
+    #Force between consecutive steps: energy difference over distance difference, as in calculate_force
+    #smooth: width (in steps) of a centered moving average applied to the forces (1: no smoothing)
+    #Outputs:
+    #extensions: (num_scans, max_steps - 1) midpoints between consecutive distances, relative to the first one (A)
+    #forces: (num_scans, max_steps - 1) in nN, NaN beyond the end of each scan
+    
+    Erels = (energies - energies[:, [0]]) * 2625.5 #in kJ, relative to the unstretched structure
+    forces = np.diff(Erels, axis=1) / np.diff(distances, axis=1) * 1.66 / 100 #kJ/A -> nN
+    extensions = (distances[:, 1:] + distances[:, :-1]) / 2 - distances[:, [0]]
+    
+    if smooth > 1: #moving average over the valid steps only
+        valid = np.isfinite(forces)
+        kernel = np.ones(smooth)
+        sums = np.apply_along_axis(np.convolve, 1, np.where(valid, forces, 0), kernel, 'same')
+        counts = np.apply_along_axis(np.convolve, 1, valid.astype(float), kernel, 'same')
+        forces = np.where(valid, sums / np.maximum(counts, 1), np.nan)
+    
+    return extensions, forces
+
+
+
+def cogef_table(filepaths,smooth=1,cache=None,return_curves=False):
+    
+    #COGEF statistics of a whole campaign as one DataFrame
+    #Inputs:
+    #filepaths: list of paths to scan_optim.xyz
+    #smooth: moving average width applied to the forces (see cogef_forces)
+    #cache: parse cache file, see analyze_scan_optim
+    #return_curves: also return extensions and forces arrays (rows in the order of filepaths)
+    #Outputs:
+    #DataFrame, one row per scan: filepath, nsteps, rupture_force (max force, nN), rupture_distance (extension where
+    #it is reached, A), max_energy (highest energy relative to the unstretched structure, kJ/mol) and energy_drop
+    #(largest energy decrease between consecutive steps, kJ/mol, 0 if the energy never decreases)
+    #Scans with less than two steps get NaN
+    #dependency: load_scan_series, cogef_forces
+    
+    distances, energies, nsteps = load_scan_series(filepaths, cache=cache)
+    extensions, forces = cogef_forces(distances, energies, smooth=smooth)
+    Erels = (energies - energies[:, [0]]) * 2625.5
+    
+    has_force = np.isfinite(forces).any(axis=1)
+    imax = np.argmax(np.where(np.isfinite(forces), forces, -np.inf), axis=1)
+    rows = np.arange(len(filepaths))
+    drops = -np.diff(Erels, axis=1)
+    
+    df = pd.DataFrame({'filepath': filepaths, 'nsteps': nsteps,
+                       'rupture_force': np.where(has_force, forces[rows, imax], np.nan),
+                       'rupture_distance': np.where(has_force, extensions[rows, imax], np.nan),
+                       'max_energy': np.where(has_force, np.nanmax(np.where(has_force[:, None], Erels, 0), axis=1),
+                                              np.nan),
+                       'energy_drop': np.where(has_force, np.nanmax(np.where(has_force[:, None], drops, 0), axis=1)
+                                               .clip(min=0), np.nan)})
+    
+    if return_curves:
+        return df, extensions, forces
+    return df
+
+
+
+def coord_number_analysis(filepath,threshold=1.5,cache=None,return_breaks=False):
     
     #Analyze the coordination number (how many coord bonds were still there) of each structure during COGEF
     #If a bond had become longer than threshold * original length: consider it broken
-    #To save time: does not involve extensive calling of mol3D
-    #(currently: could only work with octahedral/6-coord complexes)
+    #Works for any coordination number: donors are the atoms bonded to the metal in the first structure
+    #To save time: does not involve extensive calling of mol3D, all (structures, donors) distances are computed at once
     #Inputs:
     #filepath: path to scan_optim.xyz
+    #threshold: one ratio for all bonds, or ratios per donor atom index / per element, e.g. {'O': 1.4, 'N': 1.5}
+    #cache: SQLite file keeping the structural state of every frame (see file_states)
+    #return_breaks: also return a dict describing the first bond breaking
     #Outputs:
-    #A list of coordination numbers
-    
+    #A list of coordination numbers ('Failed' if no donor was found)
+    #If return_breaks: dict with donors (donor idxs), elements, first_break (step of the first broken bond, None if
+    #none broke), first_donors (donors broken at that step) and first_distance (scan distance at that step)
+    #dependency: read_xyz_frames (General/io_tools.py), file_states, first_break (General/structure_tools.py)
     
-    file = open(filepath, 'r')
-    lines = file.readlines()
+    symbols, xyzs, metas = read_xyz_frames(filepath) #(num_frames, num_atoms, 3) array
     
-    #Count number of atoms of molecule, thus number of lines in a xyz and number of total structures
-    num_atoms = lines[0].split()[0]
-    num_atoms = int(num_atoms)
-    num_lines = num_atoms+2 
-    num_frames = len(lines)/(num_lines)
-    num_frames = int(num_frames)
-    
-    #Summary all xyz into a list of lists, each list correspond to lines of single xyz
-    xyzs = [] 
-    for i in np.arange(num_frames):
-        first_line = i * num_lines
-        last_line = first_line + (num_atoms + 2) - 1 #Each xyz has num_atoms+2 lines
-        lines_each_xyz = lines[first_line:last_line+1]
-        xyzs.append(lines_each_xyz)
-    
-    #Generate a mol3D instance to find index of metal and coordinating atoms
-    file2 = open('temp.xyz', 'w')
-    file2.writelines(xyzs[0])
-    file2.close()
-    moltemp = mol3D()
-    moltemp.readfromxyz('temp.xyz')
-    liglist,ligdent,ligcons = ligand_breakdown(moltemp)
-    coords = ligcons[0] + ligcons[1]
-    coords.sort() #index of coordinating atoms
-    metal = moltemp.findMetal()[0] #index of metal
-    if len(coords) != 6: #If ligand breakdown didnt work well
+    #Structural state of every structure; donors are the atoms bonded to the metal in the first one
+    states = file_states(filepath, symbols, xyzs, cachepath=cache, bond_threshold=threshold)
+    ndonors = states['cn'].iloc[0]
+    if ndonors == 0: #If donor detection didnt work well
         return 'Failed'
     
-    #Find original bond lengths of six bonds
-    bonds_0 = []
-    for idx in coords:
-        l = distance_from_xyz(xyzs[0],metal,idx)
-        bonds_0.append(l)
+    #Bonds that had not become longer than threshold * original length
+    bond_orders = (ndonors - states['nbroken']).tolist()
+    if return_breaks == False:
+        return bond_orders
+    
+    coordination = find_coordination(symbols, xyzs[0])
+    step, donors = first_break(states)
+    breaks = {'donors': coordination['donors'].tolist(), 'elements': coordination['elements'],
+              'first_break': step, 'first_donors': donors, 'first_distance': None}
+    if step != None:
+        breaks['first_distance'] = metas[step]['distance']
+    
+    return bond_orders, breaks
+
+
+
+def coord_number_table(filepaths,threshold=1.5,cache=None):
+    
+    #Run coord_number_analysis over many COGEF scans (any coordination number)
+    #filepaths: list of paths to scan_optim.xyz
+    #Returns a DataFrame, one row per scan: filepath, cn0 (initial coordination number), cn_final, first_break,
+    #first_donors, first_element and first_distance ('Failed' rows for scans where no donor was found)
+    #dependency: coord_number_analysis
     
-    #Evaluate for each bond at each structure: had it become longer than threshold * original length
-    bond_orders = []
-    for job in np.arange(len(xyzs)):
-        order = 0
-        bonds = []
-        for idx in coords: #coord bond length of each structure
-            l = distance_from_xyz(xyzs[job],metal,idx)
-            bonds.append(l)
-        for i in np.arange(6): #compare each bond length
-            if bonds[i] < bonds_0[i] * threshold:
-                order += 1
-        bond_orders.append(order)
+    rows = []
+    for filepath in filepaths:
+        result = coord_number_analysis(filepath, threshold=threshold, cache=cache, return_breaks=True)
+        if result == 'Failed':
+            rows.append({'filepath': filepath, 'cn0': 'Failed'})
+            continue
+        bond_orders, breaks = result
+        first_elements = [breaks['elements'][breaks['donors'].index(donor)] for donor in breaks['first_donors']]
+        rows.append({'filepath': filepath, 'cn0': bond_orders[0], 'cn_final': bond_orders[-1],
+                     'first_break': breaks['first_break'], 'first_donors': breaks['first_donors'],
+                     'first_element': ','.join(first_elements), 'first_distance': breaks['first_distance']})
     
-    return bond_orders
+    return pd.DataFrame(rows)
 
 
 
-def continue_COGEF(oldpath,new_parent_path,walltime = 'same',stretch_dist = 10, dist_step = 0.2):
+def continue_COGEF(oldpath,new_parent_path,walltime = 'same',stretch_dist = 10, dist_step = 0.2, dry_run = False):
     
     #Generate new directory, input, jobscript and xyz with same name in the new parent folder
     #So that job manager could be run in the new parent path without re-running finished jobs
     #Input will be modified as continuing of COGEF
+    #The xyz of a continued job is the last converged structure of scan_optim.xyz, so that the first new step only
+    #stretches by dist_step instead of re-optimizing from the unstretched structure
+    #dry_run: only return what would be written
     #Tip: cannot change strech distance or step distance for a job that starts from scratch
+    #Returns dict: path, from_scratch, dini, dfin, nsteps (None if from scratch)
+    #dependency: write_COGEF_segment, read_xyz_frames (General/io_tools.py)
     
     #Read scan_optim
     from_scratch = False
     old_scan_path = oldpath + '/scr/scan_optim.xyz'
-    if exists(old_scan_path) == False or os.stat(old_scan_path).st_size == 0:
+    if count_steps(old_scan_path) == 0:
         from_scratch = True
     else:
-        old_scan_file = open(old_scan_path, 'r')
-        old_scan_lines = old_scan_file.readlines()
-        distances = []
-        for line in old_scan_lines:
-            if 'Converged' in line:
-                distance = line.split()[6]
-                distance = distance.replace('(','')
-                distance = distance.replace(')','')
-                distances.append(float(distance))
-        d0,dt = distances[0], distances[-1] #beginning frame and last frame finished
+        symbols, xyzs, metas = read_xyz_frames(old_scan_path)
+        converged = [i for i in np.arange(len(metas)) if 'Converged' in metas[i]['comment']]
+        d0,dt = metas[converged[0]]['distance'], metas[converged[-1]]['distance'] #beginning frame and last frame finished
+    
+    #Beginning and end point for new COGEF
+    plan = {'path': new_parent_path + '/' + oldpath, 'from_scratch': from_scratch, 'dini': None, 'dfin': None,
+            'nsteps': None}
+    if from_scratch == False:
+        dini, dfin = dt + dist_step, d0 + stretch_dist
+        nsteps = int(round((dfin - dini) / dist_step)) + 1
+        plan['dini'], plan['dfin'], plan['nsteps'] = dini, dfin, nsteps
+    if dry_run:
+        return plan
+    
+    if from_scratch == False:
+        write_COGEF_segment(oldpath, new_parent_path, dini, dfin, nsteps, symbols=symbols, coords=xyzs[converged[-1]],
+                            walltime=walltime, comment='restart from ' + str(dt))
+    else:
+        write_COGEF_segment(oldpath, new_parent_path, walltime=walltime)
+    
+    return plan
+
+
+
+def write_COGEF_segment(oldpath,new_parent_path,dini = None,dfin = None,nsteps = None,symbols = None,coords = None,
+                        walltime = 'same',comment = '',name = None):
+    
+    #Write the folder of one more COGEF scan segment of a job: new_parent_path/oldpath with the same file names
+    #Jobscript and input are copied from oldpath, with the walltime and the constraint_scan bond line replaced
+    #dini, dfin, nsteps: new bond line (None: input copied as it is)
+    #symbols, coords: starting structure (None: copy of the original xyz)
+    #name: job name of the segment if not the same as oldpath (folder, file names and their mentions in jobscript
+    #and input are renamed)
+    #dependency: write_xyz_frame (General/io_tools.py)
+    
+    if name == None:
+        name = oldpath
     
     #Make directory for continued COGEF run
-    new_path = new_parent_path + '/' + oldpath
+    new_path = new_parent_path + '/' + name
     if os.path.exists(new_parent_path) == False: #make things easier
         os.mkdir(new_parent_path)
     if os.path.exists(new_path) == False:
         os.mkdir(new_path)
     
     #Write jobscript
-    old_js = open(oldpath + '/' + oldpath + '_jobscript')
-    js_lines = old_js.readlines()
+    with open(oldpath + '/' + oldpath + '_jobscript') as f:
+        js_lines = f.readlines()
     if walltime != 'same': #if we want to change walltime
         for idx in np.arange(len(js_lines)):
             if '#$ -l h_rt' in js_lines[idx]:
-                js_lines[idx] = '#$ -l h_rt' + ' '+ walltime + '\n'
-    new_js = new_path + '/' + oldpath + '_jobscript'
+                js_lines[idx] = '#$ -l h_rt=' + walltime + '\n'
+    new_js = new_path + '/' + name + '_jobscript'
     with open(new_js, 'w') as f:
         for line in js_lines:
-            f.write(str(line))
-        f.close()
+            f.write(str(line).replace(oldpath, name))
     
     #Write input
-    if from_scratch == False:
-        dini, dfin = dt + dist_step, d0 + stretch_dist #beginning and end point for new COGEF
-        nsteps = ((dfin - dini) / dist_step) + 1
-        nsteps = int(nsteps)
-    old_in = open(oldpath + '/' + oldpath + '.in')
-    in_lines = old_in.readlines()
-    if from_scratch == False:
+    with open(oldpath + '/' + oldpath + '.in') as f:
+        in_lines = f.readlines()
+    if dini != None:
         for idx in np.arange(len(in_lines)):
-            if 'bond' in in_lines[idx]:
+            if in_lines[idx].startswith('bond '): #not bond_order_list
                 pp_pair = in_lines[idx].split()[-1]
-                in_lines[idx] = 'bond ' + str(dini) + ' ' + str(dfin) + ' ' + str(nsteps) + ' ' + pp_pair + '\n'
-    new_in = new_path + '/' + oldpath + '.in'
+                in_lines[idx] = 'bond ' + str(round(dini, 4)) + ' ' + str(round(dfin, 4)) + ' ' + str(nsteps) + ' ' + \
+                                pp_pair + '\n'
+    new_in = new_path + '/' + name + '.in'
     with open(new_in, 'w') as f:
         for line in in_lines:
-            f.write(str(line))
-        f.close()
-    
-    #Write(Copy) xyz
-    old_xyz = open(oldpath + '/' + oldpath + '.xyz')
-    xyz_lines = old_xyz.readlines()
-    new_xyz = new_path + '/' + oldpath + '.xyz'
-    with open(new_xyz,'w') as f:
-        for line in xyz_lines:
-            f.write(str(line))
-        f.close()
+            f.write(str(line).replace(oldpath, name))
+    
+    #Write xyz: given structure, or copy of the original one
+    new_xyz = new_path + '/' + name + '.xyz'
+    if coords is not None:
+        write_xyz_frame(new_xyz, symbols, coords, comment=comment)
+    else:
+        with open(oldpath + '/' + oldpath + '.xyz') as f:
+            xyz_lines = f.readlines()
+        with open(new_xyz,'w') as f:
+            for line in xyz_lines:
+                f.write(str(line))
+    
+    return new_path
+
+
+
+def scan_bounds(oldpath):
+    
+    #Beginning distance, end distance and number of steps of the constraint_scan bond line of a COGEF job input
+    #oldpath: job folder, in the current directory or given as a path (input: oldpath/folder name.in)
+    #None if not found
+    
+    inpath = oldpath + '/' + os.path.basename(os.path.normpath(oldpath)) + '.in'
+    if exists(inpath) == False:
+        return None
+    with open(inpath) as f:
+        for line in f:
+            if line.startswith('bond '):
+                fields = line.split()
+                return float(fields[1]), float(fields[2]), int(fields[3])
+    
+    return None
+
+
+
+def planned_steps(oldpath):
+    
+    #Number of scan steps asked for in the constraint_scan bond line of a COGEF job input (None if not found)
+    #dependency: scan_bounds
+    
+    bounds = scan_bounds(oldpath)
+    if bounds == None:
+        return None
+    
+    return bounds[2]
+
+
+
+def plan_COGEF_restarts(oldpaths,new_parent_path,walltime = 'same',stretch_dist = 10, dist_step = 0.2, dry_run = True,
+                        nthreads = 16):
+    
+    #Plan (and write) the restart of a whole COGEF campaign at once
+    #Each job folder is classified from its scan_optim.xyz (count_steps, read in parallel threads since it is I/O):
+    #done: all steps asked for in its input are converged, nothing to do
+    #partial: some steps converged, continued from the last converged structure (see continue_COGEF)
+    #from_scratch: no step converged, inputs copied as they are
+    #Inputs:
+    #oldpaths: list of job folders (in the current directory)
+    #new_parent_path, walltime, stretch_dist, dist_step: see continue_COGEF
+    #dry_run: only report what would be done (default); set to False to write all restart folders
+    #Outputs:
+    #DataFrame, one row per job: job, steps_done, steps_planned, status, dini, dfin, nsteps
+    #dependency: continue_COGEF, planned_steps
+    
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        steps_done = list(pool.map(lambda oldpath: count_steps(oldpath + '/scr/scan_optim.xyz'), oldpaths))
+    
+    rows = []
+    for oldpath, done in zip(oldpaths, steps_done):
+        planned = planned_steps(oldpath)
+        if planned == None:
+            planned = int(round(stretch_dist / dist_step)) + 1
+        row = {'job': oldpath, 'steps_done': done, 'steps_planned': planned, 'status': 'partial',
+               'dini': None, 'dfin': None, 'nsteps': None}
+        if done >= planned:
+            row['status'] = 'done'
+        else:
+            plan = continue_COGEF(oldpath, new_parent_path, walltime=walltime, stretch_dist=stretch_dist,
+                                  dist_step=dist_step, dry_run=dry_run)
+            if plan['from_scratch']:
+                row['status'] = 'from_scratch'
+            row['dini'], row['dfin'], row['nsteps'] = plan['dini'], plan['dfin'], plan['nsteps']
+        rows.append(row)
+    
+    df = pd.DataFrame(rows)
+    counts = df['status'].value_counts()
+    print(('Dry run: ' if dry_run else 'Written: ') + ', '.join(str(counts.get(status, 0)) + ' ' + status
+                                                          for status in ['done', 'partial', 'from_scratch']))
+    
+    return df
+
+
+
+def rupture_window(distances,energies,drop = 0.02,flatten = 0.5,fprev = None):
+    
+    #Locate the force maximum of a COGEF scan segment from its converged energies
+    #Forces between consecutive steps as in cogef_forces; their change from one step to the next is the energy curvature,
+    #which is large and positive in the harmonic region and falls to zero at the force maximum
+    #Inputs:
+    #distances, energies: converged steps of the segment (see analyze_scan_optim)
+    #drop: the maximum is bracketed once the force fell afterwards by this fraction of it (or the energy went down)
+    #flatten: the maximum is approached once the last curvature fell below this fraction of the largest one
+    #fprev: max force of the earlier segments of the scan (nN), if the maximum may have been passed before this one
+    #Outputs:
+    #dict: state ('bracketed', 'approaching', 'harmonic' or 'too_short' under 3 steps), imax (index of the step
+    #interval with the max force of this segment, i.e. between distances[imax] and distances[imax + 1]),
+    #fmax (nN, max force of this segment and the earlier ones)
+    #dependency: cogef_forces
+    
+    window = {'state': 'too_short', 'imax': None, 'fmax': fprev}
+    if len(energies) < 2:
+        return window
+    extensions, forces = cogef_forces(np.array([distances], dtype=float), np.array([energies], dtype=float))
+    forces = forces[0]
+    window['imax'] = int(np.argmax(forces))
+    window['fmax'] = forces[window['imax']]
+    if len(forces) < 2:
+        if fprev != None:
+            window['fmax'] = max(fprev, window['fmax'])
+        return window
+    
+    fall = window['fmax'] - forces[window['imax']:].min()
+    if fprev != None and fprev > window['fmax']: #maximum passed in an earlier segment
+        fall = fprev - forces.min()
+        window['fmax'] = fprev
+    curvatures = np.diff(forces)
+    if forces.min() < 0 or fall > drop * abs(window['fmax']):
+        window['state'] = 'bracketed'
+    elif curvatures[-1] < flatten * curvatures.max():
+        window['state'] = 'approaching'
+    else:
+        window['state'] = 'harmonic'
+    
+    return window
+
+
+
+def adaptive_COGEF(oldpath,new_parent_path,dend = None,fprev = None,stretch_dist = 10,coarse_step = 0.4,
+                   fine_step = 0.1,segment_dist = 2,drop = 0.02,flatten = 0.5,walltime = 'same',dry_run = False,
+                   cache = None):
+    
+    #Plan (and write) the next segment of an adaptive COGEF scan
+    #Instead of one uniform scan, a job is run as short segments (new_parent_path/oldpath, as in continue_COGEF):
+    #coarse steps through the harmonic region, fine steps only around the force maximum, which is all calculate_force
+    #needs. The first segment is a usual COGEF job with coarse steps over segment_dist (see prep_tera_input)
+    #The finished segment (scan_optim.xyz) is classified with rupture_window:
+    #harmonic: continue from the last converged structure with coarse steps
+    #approaching: continue from the last converged structure with fine steps
+    #bracketed by coarse steps: re-scan with fine steps from the converged structure one coarse step before the
+    #interval of max force, to two coarse steps after it
+    #bracketed by fine steps, or dend reached: done
+    #Every segment has the same number of steps (segment_dist / coarse_step), so the walltime can stay the same
+    #Inputs:
+    #oldpath: job folder of the finished segment (in the current directory)
+    #new_parent_path: parent folder of the next segment
+    #dend: distance (A) at which the whole scan ends, default first converged distance + stretch_dist (only right for
+    #the first segment, carry it over afterwards, see plan_adaptive_COGEF)
+    #fprev: max force of the earlier segments (nN), None for the first segment
+    #drop, flatten: see rupture_window; cache: see analyze_scan_optim; walltime: see continue_COGEF
+    #dry_run: only return what would be written
+    #Outputs:
+    #dict: path, status ('coarse', 'fine', 'refine', 'done' or 'from_scratch'), dend, fmax (nN, max force of all
+    #segments so far: the rupture force once done), dini, dfin, nsteps (None if nothing is to be scanned)
+    #dependency: rupture_window, scan_bounds, write_COGEF_segment, continue_COGEF,
+    #read_xyz_frames (General/io_tools.py)
+    
+    plan = {'path': new_parent_path + '/' + oldpath, 'status': 'done', 'dend': dend, 'fmax': fprev, 'dini': None,
+            'dfin': None, 'nsteps': None}
+    
+    scan_path = oldpath + '/scr/scan_optim.xyz'
+    if count_steps(scan_path) == 0:
+        continue_COGEF(oldpath, new_parent_path, walltime=walltime, dry_run=dry_run)
+        plan['status'] = 'from_scratch'
+        return plan
+    
+    distances, energies = analyze_scan_optim(scan_path, no_mol2=True, cache=cache)
+    if dend == None:
+        dend = distances[0] + stretch_dist
+    plan['dend'] = dend
+    window = rupture_window(distances, energies, drop=drop, flatten=flatten, fprev=fprev)
+    plan['fmax'] = window['fmax']
+    
+    #Step of the finished segment, from its input (a single converged step does not tell)
+    bounds = scan_bounds(oldpath)
+    if bounds != None and bounds[2] > 1:
+        step = (bounds[1] - bounds[0]) / (bounds[2] - 1)
+    else:
+        step = np.median(np.diff(distances)) if len(distances) > 1 else coarse_step
+    fine = step < (fine_step + coarse_step) / 2
+    
+    #Next segment
+    start = len(distances) - 1
+    if window['state'] == 'bracketed':
+        if fine:
+            return plan
+        start = max(window['imax'] - 1, 0)
+        dfin = distances[min(window['imax'] + 2, len(distances) - 1)]
+        plan['status'], dist_step = 'refine', fine_step
+    elif distances[-1] >= dend - 1e-3:
+        return plan
+    elif window['state'] == 'approaching' or fine:
+        plan['status'], dist_step = 'fine', fine_step
+        dfin = distances[start] + segment_dist * fine_step / coarse_step
+    else:
+        plan['status'], dist_step = 'coarse', coarse_step
+        dfin = distances[start] + segment_dist
+    
+    dini, dfin = distances[start] + dist_step, min(dfin, dend)
+    nsteps = max(int(round((dfin - dini) / dist_step)) + 1, 2)
+    plan['dini'], plan['dfin'], plan['nsteps'] = dini, dfin, nsteps
+    if dry_run:
+        return plan
+    
+    symbols, xyzs, metas = read_xyz_frames(scan_path)
+    converged = [i for i in np.arange(len(metas)) if 'Converged' in metas[i]['comment']]
+    write_COGEF_segment(oldpath, new_parent_path, dini, dfin, nsteps, symbols=symbols, coords=xyzs[converged[start]],
+                        walltime=walltime, comment=plan['status'] + ' from ' + str(distances[start]))
+    
+    return plan
+
+
+
+def plan_adaptive_COGEF(oldpaths,new_parent_path,previous = None,stretch_dist = 10,coarse_step = 0.4,fine_step = 0.1,
+                        segment_dist = 2,drop = 0.02,flatten = 0.5,walltime = 'same',dry_run = True,nthreads = 16,
+                        cache = None):
+    
+    #Plan (and write) the next adaptive COGEF segment of a whole campaign (see adaptive_COGEF)
+    #previous: DataFrame returned for the previous segment (e.g. saved as csv), to carry over the end distance and
+    #max force of each job; None for the first segment
+    #dry_run: only report what would be done (default); set to False to write all segment folders
+    #nthreads: jobs are planned in parallel threads since it is I/O
+    #Outputs:
+    #DataFrame, one row per job: job, status, dend, fmax, dini, dfin, nsteps (save it for the next segment)
+    #dependency: adaptive_COGEF
+    
+    carried = {}
+    if previous is not None:
+        for job, dend, fmax in zip(previous['job'], previous['dend'], previous['fmax']):
+            carried[job] = [None if pd.isna(value) else float(value) for value in [dend, fmax]]
+    
+    def plan_job(oldpath):
+        dend, fprev = carried.get(oldpath, [None, None])
+        return adaptive_COGEF(oldpath, new_parent_path, dend=dend, fprev=fprev, stretch_dist=stretch_dist,
+                              coarse_step=coarse_step, fine_step=fine_step, segment_dist=segment_dist, drop=drop,
+                              flatten=flatten, walltime=walltime, dry_run=dry_run, cache=cache)
+    
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        plans = list(pool.map(plan_job, oldpaths))
+    
+    df = pd.DataFrame(plans).drop(columns='path')
+    df.insert(0, 'job', oldpaths)
+    counts = df['status'].value_counts()
+    print(('Dry run: ' if dry_run else 'Written: ') + ', '.join(str(counts.get(status, 0)) + ' ' + status
+                                                          for status in ['coarse', 'fine', 'refine', 'done',
+                                                                         'from_scratch']))
+    
+    return df
+
+
+
+def pulling_points(oldpath):
+    
+    #0-based indexes of the two pulling points of a COGEF job, from the constraint_scan bond line of its input
+    #(terachem indexes begin with 1); None if not found
+    
+    if exists(oldpath + '/' + oldpath + '.in') == False:
+        return None
+    with open(oldpath + '/' + oldpath + '.in') as f:
+        for line in f:
+            if line.startswith('bond '):
+                return [int(idx) - 1 for idx in line.split()[-1].split('_')]
+    
+    return None
+
+
+
+def stretch_structure(coords,pp,dist):
+    
+    #Stretch a structure so that its pulling points end up dist (A) apart
+    #Atoms are moved along the pulling point axis in proportion to where they sit between the two pulling points
+    #(atoms beyond a pulling point move with it); the constrained optimization relaxes the rest
+    #pp: 0-based indexes of the pulling points
+    
+    coords = np.array(coords, dtype=float)
+    d0 = np.linalg.norm(coords[pp[1]] - coords[pp[0]])
+    axis = (coords[pp[1]] - coords[pp[0]]) / d0
+    shares = np.clip((coords - coords[pp[0]]) @ axis / d0, 0, 1) - 0.5
+    
+    return coords + np.outer(shares, axis) * (dist - d0)
+
+
+
+def window_seed(dist,pp,coords,distances = None,frames = None):
+    
+    #Starting structure of a COGEF window beginning at dist (A)
+    #Without a partial scan: coords stretched along the pulling points (see stretch_structure)
+    #With a partial scan (converged distances and frames): relaxed interpolation, i.e. linear interpolation between
+    #the two converged frames around dist, or the last converged frame if dist is beyond the scan, brought to dist
+    #Returns coordinates and how they were made ('stretch', 'scan')
+    
+    if distances is None or len(distances) == 0:
+        return stretch_structure(coords, pp, dist), 'stretch'
+    
+    distances = np.array(distances, dtype=float)
+    idx = np.searchsorted(distances, dist)
+    if idx == 0:
+        seed = frames[0]
+    elif idx == len(distances):
+        seed = frames[-1]
+    else:
+        frac = (dist - distances[idx-1]) / (distances[idx] - distances[idx-1])
+        seed = (1 - frac) * np.array(frames[idx-1]) + frac * np.array(frames[idx])
+    
+    return stretch_structure(seed, pp, dist), 'scan'
+
+
+
+def split_COGEF_windows(oldpath,new_parent_path,nwindows = 4,overlap = 1,walltime = 'same',dry_run = False):
+    
+    #Split the scan of a COGEF job into nwindows windows, run as independent jobs (e.g. one GPU each)
+    #The distance grid is the constraint_scan bond line of oldpath; grid points already converged in its
+    #scan_optim.xyz (if any) are not scanned again
+    #Each window is a job folder new_parent_path/oldpath_wk (k = 0...nwindows-1), starting from a seed structure
+    #(see window_seed), and re-scans the last overlap grid points of the window before it, so that
+    #stitch_COGEF_windows can check that neighbouring windows are on the same path
+    #dry_run: only return what would be written
+    #Returns DataFrame, one row per window: window, dini, dfin, nsteps, seed
+    #dependency: scan_bounds, pulling_points, window_seed, write_COGEF_segment, read_xyz_frames (General/io_tools.py)
+    
+    dini, dfin, nsteps = scan_bounds(oldpath)
+    grid = np.linspace(dini, dfin, nsteps)
+    pp = pulling_points(oldpath)
+    
+    #Partial scan, if any
+    distances, frames = [], []
+    scan_path = oldpath + '/scr/scan_optim.xyz'
+    if count_steps(scan_path) > 0:
+        symbols, xyzs, metas = read_xyz_frames(scan_path)
+        for meta, xyz in zip(metas, xyzs):
+            if 'Converged' in meta['comment']:
+                distances.append(meta['distance'])
+                frames.append(xyz)
+    if dry_run == False:
+        symbols, xyzs, metas = read_xyz_frames(oldpath + '/' + oldpath + '.xyz')
+        coords = xyzs[0]
+    
+    todo = np.flatnonzero(grid > (distances[-1] + 1e-3 if len(distances) > 0 else -np.inf))
+    rows = []
+    for k, chunk in enumerate(np.array_split(todo, nwindows)):
+        if len(chunk) == 0:
+            continue
+        first = max(chunk[0] - overlap, 0)
+        row = {'window': oldpath + '_w' + str(k), 'dini': grid[first], 'dfin': grid[chunk[-1]],
+               'nsteps': chunk[-1] - first + 1, 'seed': 'stretch' if len(distances) == 0 else 'scan'}
+        if dry_run == False:
+            seed, row['seed'] = window_seed(grid[first], pp, coords, distances, frames)
+            write_COGEF_segment(oldpath, new_parent_path, row['dini'], row['dfin'], row['nsteps'], symbols=symbols,
+                                coords=seed, walltime=walltime, comment='window seed at ' + str(round(grid[first], 4)),
+                                name=row['window'])
+        rows.append(row)
+    
+    return pd.DataFrame(rows)
 
+
+
+def stitch_COGEF_windows(oldpath,parent_path,nwindows = 4,tol = 4,outpath = None):
+    
+    #Stitch the windows of a split COGEF job (see split_COGEF_windows) back into one scan_optim.xyz
+    #The scan of oldpath itself (if any) comes first, then the windows in order; at the distances scanned by two
+    #neighbouring windows, the energies must agree within tol (kJ/mol), otherwise the later window followed another
+    #path (e.g. a different conformer or an early dissociation from its seed)
+    #Shared distances keep the frames of the earlier window, which come from a continuous scan
+    #Stitching stops at the first window that is missing or leaves a gap in distance
+    #outpath: stitched file, default parent_path/oldpath/scr/scan_optim.xyz, so that the stitched job can be
+    #analyzed as any other (count_steps, analyze_scan_optim, cogef_table...)
+    #Returns DataFrame, one row per junction: window, nshared, max_dE (kJ/mol), status ('ok', 'inconsistent',
+    #'unchecked' without shared distance, 'gap' or 'missing')
+    #dependency: scan_bounds, read_xyz_frames (General/io_tools.py)
+    
+    dini, dfin, nsteps = scan_bounds(oldpath)
+    step = (dfin - dini) / max(nsteps - 1, 1)
+    scan_paths = [parent_path + '/' + oldpath + '_w' + str(k) + '/scr/scan_optim.xyz' for k in np.arange(nwindows)]
+    if count_steps(oldpath + '/scr/scan_optim.xyz') > 0:
+        scan_paths = [oldpath + '/scr/scan_optim.xyz'] + scan_paths
+    
+    distances, energies, frames, comments = [], [], [], []
+    rows = []
+    for scan_path in scan_paths:
+        window = scan_path.split('/')[-3]
+        if count_steps(scan_path) == 0:
+            rows.append({'window': window, 'nshared': 0, 'max_dE': np.nan, 'status': 'missing'})
+            break
+        symbols, xyzs, metas = read_xyz_frames(scan_path)
+        converged = [i for i in np.arange(len(metas)) if 'Converged' in metas[i]['comment']]
         
+        if len(distances) > 0:
+            if metas[converged[0]]['distance'] > distances[-1] + 1.5 * step:
+                rows.append({'window': window, 'nshared': 0, 'max_dE': np.nan, 'status': 'gap'})
+                break
+            dEs = []
+            for i in converged:
+                match = np.flatnonzero(np.isclose(distances, metas[i]['distance'], atol=1e-3))
+                if len(match) > 0:
+                    dEs.append(abs(metas[i]['energy'] - energies[match[0]]) * 2625.5)
+            row = {'window': window, 'nshared': len(dEs), 'max_dE': max(dEs) if len(dEs) > 0 else np.nan,
+                   'status': 'unchecked'}
+            if len(dEs) > 0:
+                row['status'] = 'ok' if row['max_dE'] <= tol else 'inconsistent'
+            rows.append(row)
         
-def iters_each_step(filepath):
+        for i in converged:
+            if len(distances) == 0 or metas[i]['distance'] > distances[-1] + 1e-3:
+                distances.append(metas[i]['distance'])
+                energies.append(metas[i]['energy'])
+                frames.append(xyzs[i])
+                comments.append(metas[i]['comment'])
+    
+    if len(frames) == 0:
+        return pd.DataFrame(rows, columns=['window', 'nshared', 'max_dE', 'status'])
+    if outpath == None:
+        outpath = parent_path + '/' + oldpath + '/scr/scan_optim.xyz'
+    if os.path.dirname(outpath) != '' and os.path.exists(os.path.dirname(outpath)) == False:
+        os.makedirs(os.path.dirname(outpath))
+    with open(outpath, 'w') as f:
+        for comment, frame in zip(comments, frames):
+            f.write(str(len(symbols)) + '\n' + comment + '\n')
+            for sym, coord in zip(symbols, frame):
+                f.write('%s %.8f %.8f %.8f\n' % (sym, coord[0], coord[1], coord[2]))
+    
+    return pd.DataFrame(rows, columns=['window', 'nshared', 'max_dE', 'status'])
+
+
+
+#Version of the results of iters_each_step kept in parse caches: bump it when their shape changes
+ITERS_VERSION = 1
+
+
+
+def iters_each_step(filepath, cache=None):
     
     #Analyze for each COGEF scan step, how many optimization steps were perfromed
     #Input:
     #filepath: path to optim.xyz
+    #cache: parse cache file, to reuse the result as long as optim.xyz has not changed
     #Output:
     #list of num frames for each structure
+    #dependency: cached_call (General/parse_cache.py), open_output, find_output (General/io_tools.py)
     
+    if cache != None:
+        return cached_call(find_output(filepath), iters_each_step, (filepath,), cachepath=cache, version=ITERS_VERSION)
+
     try:
-        file = open(filepath,'r')
+        file = open_output(filepath,'r')
     except:
         return 'No File' #File doesnt exist
     lines = file.readlines()
@@ -309,7 +848,108 @@ def iters_each_step(filepath):
 
 
 
-def plot_nsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
+#Version of the results of job_cost kept in parse caches (cost_table): bump it when their columns change
+JOB_COST_VERSION = 1
+
+
+
+def job_cost(jobpath):
+    
+    #Optimizer cost of every scan step of one COGEF job (rows of cost_table)
+    #Optimizer iterations from the frame numbers of scr/optim.xyz (as iters_each_step, but the last step is kept
+    #even if it never converged), distances and energies from the converged structures of scr/scan_optim.xyz
+    #Steps that did not converge get the distance planned in the input (see scan_bounds) and a NaN energy
+    #Molecule and spin from the folder name, refcode(_ap1_ap2)_spin as written by prep_tera_input
+    #dependency: analyze_scan_optim, scan_bounds, find_output, open_output (General/io_tools.py)
+    
+    name = os.path.basename(os.path.normpath(jobpath))
+    molecule, spin = name.rsplit('_', 1) if '_' in name else (name, '')
+    
+    #Frame numbers restart from 0 at each scan step
+    iters = []
+    optim = find_output(jobpath + '/scr/optim.xyz')
+    if exists(optim):
+        with open_output(optim, 'r') as f:
+            nums = [int(line.split()[2]) for line in f if 'frame' in line]
+        for i in np.arange(1, len(nums)):
+            if nums[i] == 0:
+                iters.append(nums[i-1] + 1)
+        if len(nums) > 0:
+            iters.append(nums[-1] + 1)
+    
+    distances, energies = [], []
+    if exists(find_output(jobpath + '/scr/scan_optim.xyz')):
+        distances, energies = analyze_scan_optim(jobpath + '/scr/scan_optim.xyz', no_mol2=True)
+    
+    nsteps = max(len(iters), len(distances))
+    grid = np.full(nsteps, np.nan)
+    bounds = scan_bounds(jobpath)
+    if bounds != None and bounds[2] > 1:
+        grid = bounds[0] + np.arange(nsteps) * (bounds[1] - bounds[0]) / (bounds[2] - 1)
+    grid[:len(distances)] = distances
+    
+    df = pd.DataFrame({'molecule': molecule, 'spin': spin, 'step': np.arange(nsteps), 'distance': grid,
+                       'energy': energies + [np.nan] * (nsteps - len(energies)),
+                       'iterations': iters + [np.nan] * (nsteps - len(iters)),
+                       'converged': np.arange(nsteps) < len(distances)})
+    df['stretch'] = (df['distance'] - df['distance'].iloc[0]).round(4) if nsteps > 0 else []
+    
+    return df
+
+
+
+def cost_table(jobpaths,nthreads = 16,cache = None):
+    
+    #Optimizer cost of a whole COGEF campaign as one tidy table, one row per scan step of every job
+    #Inputs:
+    #jobpaths: list of COGEF job folders
+    #nthreads: jobs are parsed in parallel threads
+    #cache: parse cache file; a job is only parsed again once its optim.xyz, scan_optim.xyz or input changed
+    #Outputs:
+    #DataFrame: job, molecule, spin, step, distance, stretch (distance from the first step, A), energy (Hartree),
+    #iterations (optimizer iterations of the step), converged
+    #Aggregate views are then plain groupbys, see cost_by_distance
+    #dependency: job_cost, cached_call (General/parse_cache.py), find_output (General/io_tools.py)
+    
+    def parse_job(jobpath):
+        if cache == None:
+            return job_cost(jobpath)
+        name = os.path.basename(os.path.normpath(jobpath))
+        files = [find_output(jobpath + '/scr/optim.xyz'), find_output(jobpath + '/scr/scan_optim.xyz'),
+                 jobpath + '/' + name + '.in']
+        return cached_call(files, job_cost, (jobpath,), cachepath=cache, version=JOB_COST_VERSION)
+    
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        dfs = list(pool.map(parse_job, jobpaths))
+    
+    for jobpath, df in zip(jobpaths, dfs):
+        df.insert(0, 'job', jobpath)
+    columns = ['job', 'molecule', 'spin', 'step', 'distance', 'stretch', 'energy', 'iterations', 'converged']
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=columns)
+    
+    return pd.concat(dfs, ignore_index=True)[columns]
+
+
+
+def cost_by_distance(table,portion = False,cutoff = 0):
+    
+    #Sum of the optimizer iterations of all jobs at each stretching distance (the sums of plot_nsteps_vs_dist)
+    #portion: sum the portion of each job's iterations spent at each distance instead (as plot_pnsteps_vs_dist)
+    #cutoff: only count jobs with more than cutoff steps
+    #Returns Series indexed by stretch (A)
+    
+    nsteps = table.groupby('job')['step'].transform('size')
+    table = table[(nsteps > cutoff) & table['iterations'].notna()]
+    values = table['iterations']
+    if portion:
+        values = values / table.groupby('job')['iterations'].transform('sum')
+    
+    return values.groupby(table['stretch']).sum()
+
+
+
+def plot_nsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0,savepath=None,show=True):
     
     #For each molecule, plot the number of structures generated at optimization at each distance during COGEF
     #Also plot the sum of number of structures durinng each optimization at distances for all molecules
@@ -319,8 +959,11 @@ def plot_nsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
     #at each distance for every molecule
     #dist and sep: total distance and distance at each step for COGEF
     #cutoff: only analyze molecules that undergo at least certain num of steps
+    #savepath: write the figures to savepath and to savepath with _sum before its extension
+    #show: show the figures (or close them)
     #Outputs:
     #Two plots, and a list of the sum num steps for all structures
+    #dependency: finish_figure (General/render.py)
     
     plt.figure()
     plt.xlabel('Stretching Distance (A)')
@@ -330,10 +973,10 @@ def plot_nsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
         plt.title(title)
     for nframes in lfs:
         if type(nframes) != str and len(nframes) > cutoff:
-            xs = np.arange(len(nframes)) * 0.2
+            xs = np.arange(len(nframes)) * sep
             nframes = np.array(nframes)
             plt.plot(xs,nframes)
-    plt.show()
+    finish_figure(savepath=savepath, show=show)
 
     plt.figure()
     plt.xlabel('Stretching Distance (A)')
@@ -347,11 +990,16 @@ def plot_nsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
             if type(nframes) != str and len(nframes) > i and len(nframes) > cutoff:
                 count += int(nframes[i])
         sumnums.append(count)
-    plt.plot(np.arange(0,dist+sep,sep),sumnums)
+    plt.plot(np.arange(len(sumnums))*sep,sumnums)
+    if savepath != None:
+        savepath = os.path.splitext(savepath)[0] + '_sum' + os.path.splitext(savepath)[1]
+    finish_figure(savepath=savepath, show=show)
+    
+    return sumnums
 
     
     
-def plot_pnsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
+def plot_pnsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0,savepath=None,show=True):
     
     #For each molecule, plot the number of structures generated at optimization at each distance during COGEF divided
     #by total number of structures generated at all distances (portion)
@@ -362,8 +1010,11 @@ def plot_pnsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
     #at each distance for every molecule
     #dist and sep: total distance and distance at each step for COGEF
     #cutoff: only analyze molecules that undergo at least certain num of steps
+    #savepath: write the figures to savepath and to savepath with _sum before its extension
+    #show: show the figures (or close them)
     #Outputs:
     #Two plots, and a list of the sum portion num steps for all structures
+    #dependency: finish_figure (General/render.py)
     
     plt.figure()
     plt.xlabel('Stretching Distance (A)')
@@ -373,10 +1024,10 @@ def plot_pnsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
         plt.title(title)
     for nframes in lfs:
         if type(nframes) != str and len(nframes) > cutoff:
-            xs = np.arange(len(nframes)) * 0.2
+            xs = np.arange(len(nframes)) * sep
             nframes = np.array(nframes)
             plt.plot(xs,nframes/sum(nframes))
-    plt.show()
+    finish_figure(savepath=savepath, show=show)
 
     plt.figure()
     plt.xlabel('Stretching Distance (A)')
@@ -390,7 +1041,12 @@ def plot_pnsteps_vs_dist(lfs,dist=10,sep=0.2,cutoff=0):
             if type(nframes) != str and len(nframes) > i and len(nframes) > cutoff:
                 count += nframes[i]/sum(nframes)
         sumnums.append(count)
-    plt.plot(np.arange(0,dist+sep,sep),sumnums)
+    plt.plot(np.arange(len(sumnums))*sep,sumnums)
+    if savepath != None:
+        savepath = os.path.splitext(savepath)[0] + '_sum' + os.path.splitext(savepath)[1]
+    finish_figure(savepath=savepath, show=show)
+    
+    return sumnums
     
 
 
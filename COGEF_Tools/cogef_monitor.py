@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import numpy as np
+from molSimplify.job_manager.tools import call_bash, list_active_jobs
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'General'))
+from structure_tools import find_coordination, frame_states #same dissociation criteria as the analysis scripts
+
+
+#Monitor of running TeraChem COGEF jobs on Gibraltar (SGE): stops a scan once the complex has broken
+#Each job's scr/scan_optim.xyz is tailed (only the bytes appended since the previous poll are read), and every new
+#converged structure is checked against the first one with the criteria of coord_number_analysis (a metal-donor bond
+#longer than threshold * its original length is broken) and has_dissociated (a ligand lost a donor)
+#A job is killed with qdel once post_steps more steps have converged after the rupture and the complex stayed broken
+#Every rupture and kill is appended to an audit log (tab separated)
+#The criteria come from General/structure_tools.py (imported from the repository this script sits in)
+#The name of job should correspond to the folder that job inputs are located, as for dynamic_control.py
+
+
+LOG_COLUMNS = ['time', 'job', 'jobid', 'action', 'step', 'distance', 'cn', 'denticity']
+
+
+#Function to judge a converged structure against the first one, with the shared criteria of structure_tools
+def rupture_state(coordination, coords, threshold=1.5):
+
+    #cn: donors whose bond to the metal is not longer than threshold * original length (coord_number_analysis)
+    #denticity: donors of each ligand within covalent bonding distance of the metal (has_dissociated)
+    #Returns cn, denticity (list) and whether the complex is broken by either criterion
+    #dependency: frame_states (General/structure_tools.py)
+
+    state = frame_states(coordination, [coords], bond_threshold=threshold).to_dict('records')[0]
+    cn = len(coordination['donors']) - int(state['nbroken'])
+
+    return cn, state['denticity'], state['nbroken'] > 0 or state['intact'] == False
+
+
+#Function to read the converged structures appended to a scan_optim.xyz since the previous call
+def tail_scan(filepath, job):
+
+    #job: dict keeping the byte offset reached, the first bytes of the file and the number of atoms; reset if the file
+    #was overwritten (resubmission: shorter file, or first bytes that changed), in which case everything is read again
+    #A frame still being written is left for the next call
+    #Returns list of (distance, coords) of the new converged structures, and whether the file was reset
+
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        head = f.read(256) #to detect a file overwritten by output at least as large
+    reset = False
+    if size < job['offset'] or head[:len(job['head'])] != job['head']:
+        job['offset'], job['natoms'], reset = 0, None, True
+    job['head'] = head
+    if size == job['offset']:
+        return [], reset
+
+    with open(filepath, 'rb') as f:
+        f.seek(job['offset'])
+        lines = f.read().split(b'\n') #last element: line not finished yet (or empty)
+
+    new = []
+    i = 0
+    while i < len(lines) - 1:
+        if job['natoms'] == None:
+            job['natoms'] = int(lines[i])
+        if i + job['natoms'] + 2 > len(lines) - 1: #frame not complete yet
+            break
+        comment = lines[i+1].decode()
+        fields = comment.split()
+        if 'Converged' in comment and len(fields) > 6:
+            rows = [line.decode().split() for line in lines[i+2:i+2+job['natoms']]]
+            job['symbols'] = [row[0] for row in rows]
+            new.append((float(fields[6].replace('(','').replace(')','')), np.array([row[1:4] for row in rows],
+                                                                                    dtype=float)))
+        job['offset'] += sum(len(line) + 1 for line in lines[i:i+2+job['natoms']])
+        i += job['natoms'] + 2
+
+    return new, reset
+
+
+#Function to append a line to the audit log (header written when the log is created)
+def log_action(logpath, row):
+
+    new = os.path.exists(logpath) == False
+    with open(logpath, 'a') as f:
+        if new:
+            f.write('\t'.join(LOG_COLUMNS) + '\n')
+        f.write('\t'.join(str(row.get(column, '')) for column in LOG_COLUMNS) + '\n')
+    print(row['action'], row['job'], 'step', row['step'], 'distance', row['distance'])
+
+
+#Function to update one job with its new structures: returns True once it should be killed
+def update_job(basename, jobid, job, post_steps=3, threshold=1.5, logpath='cogef_monitor.log'):
+
+    #job: state kept between polls (see tail_scan); the first converged structure is the reference one
+    #Rupture: first step where the complex is broken (see rupture_state); a job that comes back intact is not killed,
+    #the rupture is looked for again afterwards
+    #dependency: find_coordination (General/structure_tools.py)
+
+    filepath = basename + '/scr/scan_optim.xyz'
+    if os.path.exists(filepath) == False:
+        return False
+    new, reset = tail_scan(filepath, job)
+    if reset:
+        job['coordination'], job['nsteps'], job['rupture'] = None, 0, None
+
+    for distance, coords in new:
+        if job['coordination'] == None:
+            job['coordination'] = find_coordination(job['symbols'], coords)
+        cn, denticity, broken = rupture_state(job['coordination'], coords, threshold)
+        if broken and job['rupture'] == None:
+            job['rupture'] = job['nsteps']
+            log_action(logpath, {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'job': basename, 'jobid': jobid,
+                                 'action': 'rupture', 'step': job['nsteps'], 'distance': distance, 'cn': cn,
+                                 'denticity': denticity})
+        elif broken == False:
+            job['rupture'] = None
+        job['last'] = {'step': job['nsteps'], 'distance': distance, 'cn': cn, 'denticity': denticity}
+        job['nsteps'] += 1
+
+    return job['rupture'] != None and job['nsteps'] - 1 - job['rupture'] >= post_steps
+
+
+#Function to kill jobs with a single qdel call, logging each of them
+def kill_jobs(names, ids, jobs, logpath='cogef_monitor.log', dry_run=False):
+
+    if len(ids) == 0:
+        return
+    if dry_run == False:
+        call_bash('qdel ' + ' '.join(str(jobid) for jobid in ids))
+    for basename, jobid in zip(names, ids):
+        row = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'job': basename, 'jobid': jobid,
+               'action': 'dry_run' if dry_run else 'qdel'}
+        row.update(jobs[basename]['last'])
+        log_action(logpath, row)
+
+
+#Monitor: poll the active jobs and kill the broken ones
+def monitor(post_steps=3, threshold=1.5, poll=300, logpath='cogef_monitor.log', dry_run=False, max_polls=None):
+
+    #post_steps: converged steps to keep after the rupture before killing the job (0: kill at the rupture)
+    #threshold: bond length ratio for a broken metal-donor bond, as in coord_number_analysis
+    #dry_run: only log which jobs would be killed (action 'dry_run'), without qdel
+    #max_polls: stop after this many polls (default: run until interrupted); 1 for a one-shot check
+    #Returns the number of jobs killed
+
+    jobs = {} #basename -> offset, head, natoms, symbols, coordination, nsteps, rupture step and last step checked
+    killed = set() #ids already killed, which may still be listed while they are being taken down
+    npolls = 0
+    while max_polls == None or npolls < max_polls:
+        names, ids = list_active_jobs(ids=True)
+        kill_names, kill_ids = [], []
+        for basename, jobid in zip(names, ids):
+            if jobid in killed:
+                continue
+            if basename not in jobs:
+                jobs[basename] = {'offset': 0, 'head': b'', 'natoms': None, 'symbols': None, 'coordination': None,
+                                  'nsteps': 0, 'rupture': None, 'last': {}}
+            if update_job(basename, jobid, jobs[basename], post_steps, threshold, logpath):
+                kill_names.append(basename)
+                kill_ids.append(jobid)
+
+        kill_jobs(kill_names, kill_ids, jobs, logpath, dry_run)
+        killed.update(kill_ids)
+        for basename in list(jobs): #forget jobs that left the queue
+            if basename not in names or basename in kill_names:
+                del jobs[basename]
+
+        npolls += 1
+        if max_polls == None or npolls < max_polls:
+            time.sleep(poll)
+
+    return len(killed)
+
+
+#Usage:
+#python cogef_monitor.py [post_steps]: check all active jobs once
+#python cogef_monitor.py watch [post_steps] [poll seconds]: keep watching them
+#add dry to either of them to only log what would be killed, e.g. python cogef_monitor.py watch 3 300 dry
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != 'dry']
+    dry_run = 'dry' in sys.argv[1:]
+    if len(args) > 0 and args[0] == 'watch':
+        post_steps = int(args[1]) if len(args) > 1 else 3
+        poll = int(args[2]) if len(args) > 2 else 300
+        monitor(post_steps = post_steps, poll = poll, dry_run = dry_run)
+    else:
+        post_steps = int(args[0]) if len(args) > 0 else 3
+        num_killed = monitor(post_steps = post_steps, dry_run = dry_run, max_polls = 1)
+        print(num_killed, ' jobs killed')
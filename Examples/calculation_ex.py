@@ -7,12 +7,16 @@ from molSimplify.Classes.atom3D import atom3D
 
 
 
-df = pd.read_csv('opt_natoms.csv')
+#Scalar columns only (General/campaign_store.py); geometries are read for the remaining rows only, see below
+df = load_campaign('opt_natoms')
 #Spin-splitting filtering
 df = df[df.Ehsls > 0]
 df = df[df.Ehsls < 30]
 #Size: 0 - 74 
 df = df[df.natoms < 75]
+#Geometries of the remaining rows, read once per column
+df = df.join(pd.DataFrame({column: load_geometry('opt_natoms', column, df.index)
+                           for column in ['mol2ls', 'mol2is', 'mol2hs']}))
 
 
 
@@ -28,7 +28,9 @@ df = pd.concat([df1,df2],axis=0)
 #All rows in round3 collection are in round2 collection
 #Round 3 collection has new columns
 
-df1 = pd.read_csv('round2_all_recorded.csv')
+#Round tables kept as campaign stores (General/campaign_store.py): every geometry column of round 2 (round 1 and
+#round 2 mol2s) is kept as in the csv, and only the three round 3 geometries to be joined are read
+df1 = load_campaign('round2_all_recorded', geometries=geom_columns('round2_all_recorded'))
 
 refnames = []
 for i in np.arange(df1.shape[0]):
@@ -47,7 +49,7 @@ for column in columns:
 df1 = df1.drop(columns=drops)
 
 
-df2 = pd.read_csv('round3_all_recorded.csv')
+df2 = load_campaign('round3_all_recorded', geometries=['round3_mol2ls', 'round3_mol2is', 'round3_mol2hs'])
 
 refnames = []
 for i in np.arange(df2.shape[0]):
@@ -93,7 +93,11 @@ plt.show()
 
 
 ################################Analayze Spin Splitting#####################################
-def plot_Ehsls(Ecolumn, title, size=(8,6), width=0.3, color='tab:blue', return_counts=True):
+def plot_Ehsls(Ecolumn, title, size=(8,6), width=0.3, color='tab:blue', return_counts=True, savepath=None,
+               show=True):
+    
+    #savepath: write the plot there, show: show it (or close it)
+    #dependency: finish_figure (General/render.py)
     
     counts = np.histogram(Ecolumn,bins = [0,5,10,20,30,1000])
     counts = counts[0]
@@ -111,5 +115,5 @@ def plot_Ehsls(Ecolumn, title, size=(8,6), width=0.3, color='tab:blue', return_c
     ax.set_xticks(x, Es)
     ax.set_xlabel('HS-LS Spin Splitting Energy (kcal/mol)')
     
-    plt.show()
+    finish_figure(fig, savepath=savepath, show=show)
 
@@ -0,0 +1,233 @@
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from molSimplify.Classes.mol3D import mol3D
+
+
+
+#A campaign store is a folder holding one round table:
+#scalars.csv: every column except geometries, loaded exactly as the csv files used so far
+#geomkeys.csv: the geometry (mol2) columns, holding short geometry keys instead of mol2 strings
+#store.json: path (relative to the store) of the geometry database the keys refer to
+#The geometry database is content-addressed: a geometry is stored (zlib-compressed) once under the hash of its
+#elements and rounded coordinates, however many rows, columns, spins or rounds carry it. Give several stores the
+#same geomdb to share it between rounds
+
+
+
+def is_geom_column(column):
+
+    #Columns holding mol2 strings, e.g. round1_mol2ls, mol2LS_0nN
+
+    return 'mol2' in column
+
+
+
+def is_geom_key(value):
+
+    #Geometry keys look like geo_0123456789abcdef; other values of geometry columns ('Failed', 'Diss', NaN...) are
+    #kept as they are
+
+    return type(value) == str and value.startswith('geo_')
+
+
+
+def geometry_key(mol2, decimals=4):
+
+    #Canonical key of a mol2 string: hash of its elements and coordinates rounded to decimals (in A)
+    #Element read from the atom type (C.ar -> C)
+
+    lines = mol2.splitlines()
+    first = lines.index('@<TRIPOS>ATOM') + 1
+    rows = []
+    for line in lines[first:]:
+        if line.startswith('@<TRIPOS>'):
+            break
+        fields = line.split()
+        if len(fields) >= 6:
+            coord = np.round(np.array(fields[2:5], dtype=float), decimals) + 0.0 #+0.0: no -0.0
+            rows.append(fields[5].split('.')[0] + ' ' + ' '.join('%.*f' % (decimals, x) for x in coord))
+
+    return 'geo_' + hashlib.sha1('\n'.join(rows).encode()).hexdigest()[:16]
+
+
+
+def put_geometries(geomdb, mol2s):
+
+    #Store mol2 strings into a geometry database (created if needed) and return their keys
+    #Values that are not mol2 strings ('Failed', 'Diss', NaN...) are returned unchanged
+
+    con = sqlite3.connect(geomdb)
+    con.execute('CREATE TABLE IF NOT EXISTS geometries (key TEXT PRIMARY KEY, mol2 BLOB)')
+    keys, rows = [], {}
+    for mol2 in mol2s:
+        if type(mol2) == str and '@<TRIPOS>ATOM' in mol2:
+            key = geometry_key(mol2)
+            if key not in rows:
+                rows[key] = zlib.compress(mol2.encode())
+            keys.append(key)
+        else:
+            keys.append(mol2)
+    con.executemany('INSERT OR IGNORE INTO geometries VALUES (?, ?)', rows.items())
+    con.commit()
+    con.close()
+
+    return keys
+
+
+
+@lru_cache(maxsize=4096)
+def get_geometry(geomdb, key):
+
+    #mol2 string stored under key (each geometry is decompressed once per session)
+
+    con = sqlite3.connect(geomdb)
+    row = con.execute('SELECT mol2 FROM geometries WHERE key = ?', (key,)).fetchone()
+    con.close()
+    if row == None:
+        raise KeyError(key + ' not found in ' + geomdb)
+
+    return zlib.decompress(row[0]).decode()
+
+
+
+def get_geometries(geomdb, keys):
+
+    #mol2 strings of many keys at once, read with a single connection (values that are not keys are skipped)
+    #Returns dict key -> mol2 string
+
+    keys = sorted(set(key for key in keys if is_geom_key(key)))
+    mol2s = {}
+    con = sqlite3.connect(geomdb)
+    for first in range(0, len(keys), 500): #SQLite limits the number of parameters of a query
+        chunk = keys[first:first+500]
+        query = 'SELECT key, mol2 FROM geometries WHERE key IN (' + ','.join('?' * len(chunk)) + ')'
+        for key, mol2 in con.execute(query, chunk):
+            mol2s[key] = zlib.decompress(mol2).decode()
+    con.close()
+    missing = [key for key in keys if key not in mol2s]
+    if len(missing) > 0:
+        raise KeyError(missing[0] + ' not found in ' + geomdb)
+
+    return mol2s
+
+
+
+@lru_cache(maxsize=1024)
+def get_mol3D(geomdb, key):
+
+    #mol3D of the geometry stored under key, parsed once per session
+    #Tip: the object is shared between callers, make a copy (copy.deepcopy) before modifying it
+
+    molecule = mol3D()
+    molecule.readfrommol2(get_geometry(geomdb, key), readstring=True)
+
+    return molecule
+
+
+
+def save_campaign(df, storepath, geom_columns=None, geomdb=None):
+
+    #Write a campaign DataFrame into a store, keeping geometries apart from scalar columns
+    #df: DataFrame with a unique index (rows are matched between scalars and geometries through it)
+    #geom_columns: columns holding mol2 strings (or keys), default every column with 'mol2' in its name
+    #geomdb: geometry database to use, default storepath/geoms.sqlite
+    #An existing store at storepath is overwritten (the geometry database is only added to)
+
+    if df.index.is_unique == False:
+        raise ValueError('DataFrame index must be unique to be stored')
+    if geom_columns == None:
+        geom_columns = [column for column in df.columns if is_geom_column(column)]
+    if geomdb == None:
+        geomdb = storepath + '/geoms.sqlite'
+
+    if not os.path.exists(storepath):
+        os.makedirs(storepath)
+
+    df.drop(columns=geom_columns).to_csv(storepath + '/scalars.csv')
+
+    dfkeys = pd.DataFrame(index=df.index)
+    for column in geom_columns:
+        dfkeys[column] = put_geometries(geomdb, df[column].tolist())
+    dfkeys.to_csv(storepath + '/geomkeys.csv')
+
+    with open(storepath + '/store.json', 'w') as f:
+        json.dump({'geomdb': os.path.relpath(geomdb, storepath)}, f) #relative: campaign folders can be moved
+
+
+
+def csv_to_campaign(csvpath, storepath, geomdb=None):
+
+    #Convert a round table saved as csv (with embedded mol2 strings) into a store
+    #Leftover 'Unnamed' index columns from previous to_csv calls are dropped
+
+    df = pd.read_csv(csvpath)
+    df = df.drop(columns=[column for column in df.columns if 'Unnamed' in column])
+    save_campaign(df, storepath, geomdb=geomdb)
+
+
+
+def store_geomdb(storepath):
+
+    #Path of the geometry database used by a store
+
+    with open(storepath + '/store.json', 'r') as f:
+        return os.path.normpath(os.path.join(storepath, json.load(f)['geomdb']))
+
+
+
+def geom_columns(storepath):
+
+    #List the geometry columns recorded in a store
+
+    return pd.read_csv(storepath + '/geomkeys.csv', index_col=0, nrows=0).columns.tolist()
+
+
+
+def load_geometry(storepath, column, index=None, keys=False):
+
+    #Lazily load one geometry column
+    #index: None for the whole column, a list of row indexes, or a single row index
+    #keys: return geometry keys instead of mol2 strings (see get_geometry, get_mol3D)
+    #Returns a Series, or a single value for a single row index
+
+    single = index is not None and np.ndim(index) == 0
+    values = pd.read_csv(storepath + '/geomkeys.csv', index_col=0)[column] #keys only: small
+    if single:
+        values = values.loc[[index]]
+    elif index is not None:
+        values = values.reindex(index)
+
+    if keys == False:
+        mol2s = get_geometries(store_geomdb(storepath), values.tolist())
+        values = values.map(lambda value: mol2s[value] if is_geom_key(value) else value)
+
+    if single:
+        return values.iloc[0]
+    return values
+
+
+
+def load_campaign(storepath, columns=None, geometries=None, keys=False):
+
+    #Load the scalar columns of a store as a DataFrame; no geometry text is read unless asked for
+    #columns: list of scalar columns to load (default all)
+    #geometries: list of geometry columns to attach to the DataFrame (default none)
+    #keys: attach geometry keys instead of mol2 strings
+
+    usecols = None
+    if columns != None:
+        first = pd.read_csv(storepath + '/scalars.csv', nrows=0).columns[0] #index column
+        usecols = [first] + list(columns)
+    df = pd.read_csv(storepath + '/scalars.csv', index_col=0, usecols=usecols)
+
+    if geometries != None:
+        for column in geometries:
+            df[column] = load_geometry(storepath, column, df.index, keys=keys)
+
+    return df
@@ -163,18 +163,18 @@ def find_cbond_angle(molecule,ccaid=None):
       idxs = ligand_breakdown(molecule)[2][0]
       idx1,idx2,idx3 = idxs[0],idxs[1],idxs[2]
       
-     metal = molecule.getAtom(metal_id)
-     atom1 = molecule.getAtom(idx1)
-     atom2 = molecule.getAtom(idx2)
-     atom3 = molecule.getAtom(idx3)
-     v1 = np.array(metal.distancev(atom1))
-     v2 = np.array(metal.distancev(atom2))
-     v3 = np.array(metal.distancev(atom3))
-     cmcangle1 = vecangle(v1,v2)
-     cmcangle2 = vecangle(v1,v3)
-     cmcangle3 = vecangle(v2,v3)
+    metal = molecule.getAtom(metal_id)
+    atom1 = molecule.getAtom(idx1)
+    atom2 = molecule.getAtom(idx2)
+    atom3 = molecule.getAtom(idx3)
+    v1 = np.array(metal.distancev(atom1))
+    v2 = np.array(metal.distancev(atom2))
+    v3 = np.array(metal.distancev(atom3))
+    cmcangle1 = vecangle(v1,v2)
+    cmcangle2 = vecangle(v1,v3)
+    cmcangle3 = vecangle(v2,v3)
       
-     return [cmcangle1,cmcangle2,cmcangle3],[(idx1,idx2),(idx1,idx3),(idx2,idx3)]
+    return [cmcangle1,cmcangle2,cmcangle3],[(idx1,idx2),(idx1,idx3),(idx2,idx3)]
 
 
 
@@ -188,6 +188,7 @@ def find_path_between_coordatoms(molecule,symmetry,returnelements=False):
     #symmetry:mer or fac
     #Returns:
     #catom1, catom2, catom3, pathlength12,pathlength13,pathlength23
+    #dependency: bond_pairs (General/structure_tools.py)
     
     catoms = ligand_breakdown(molecule)[2][0]
     if symmetry == 'mer':
@@ -206,27 +207,17 @@ def find_path_between_coordatoms(molecule,symmetry,returnelements=False):
         catom2 = catoms[1]
         catom3 = catoms[2]
     
+    #Bond graph of the ligands (metal left out) from a cell-list neighbour search on the coordinates
+    #The molecule itself is not modified and atom indexes stay those of the complex
     metal_id = molecule.findMetal()[0]
-    molecule.deleteatom(metal_id)
-    if metal_id < catom1:
-        catom1_nm = catom1 - 1
-    elif metal_id > catom1:
-        catom1_nm = catom1
-    if metal_id < catom2:
-        catom2_nm = catom2 - 1
-    elif metal_id > catom2:
-        catom2_nm = catom2
-    if metal_id < catom3:
-        catom3_nm = catom3 - 1
-    elif metal_id > catom3:
-        catom3_nm = catom3
-    
-    molecule.createMolecularGraph()
-    g = molecule.graph
-    gx = nx.from_numpy_matrix(g)
-    paths12 = nx.all_shortest_paths(gx,source=catom1_nm,target=catom2_nm)
-    paths13 = nx.all_shortest_paths(gx,source=catom1_nm,target=catom3_nm)
-    paths23 = nx.all_shortest_paths(gx,source=catom2_nm,target=catom3_nm)
+    symbols = [atom.symbol() for atom in molecule.getAtoms()]
+    ii, jj = bond_pairs(symbols, np.array(molecule.coordsvect()))
+    gx = nx.Graph()
+    gx.add_nodes_from(range(len(symbols)))
+    gx.add_edges_from([(i, j) for i, j in zip(ii.tolist(), jj.tolist()) if i != metal_id and j != metal_id])
+    paths12 = nx.all_shortest_paths(gx,source=catom1,target=catom2)
+    paths13 = nx.all_shortest_paths(gx,source=catom1,target=catom3)
+    paths23 = nx.all_shortest_paths(gx,source=catom2,target=catom3)
     
     len12,len13,len23 = 0,0,0
     for path in paths12:
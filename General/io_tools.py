@@ -0,0 +1,384 @@
+import os
+import sys
+import bz2
+import gzip
+import json
+import lzma
+import shutil
+import numpy as np
+try:
+    import zstandard #optional: .zst outputs are only readable (and writable) when it is installed
+except ImportError:
+    zstandard = None
+
+
+
+#Finished outputs and trajectories can be archived (compressed) in place: X.out becomes X.out.gz, X.out.xz...
+#Readers are given the original path as before and find the archived file themselves (find_output, open_output)
+COMPRESSED_SUFFIXES = ['.gz', '.xz', '.bz2', '.zst']
+
+
+
+def find_output(filepath):
+
+    #Path under which an output is stored: filepath itself, or its archived version filepath.gz/.xz/.bz2/.zst
+    #Returns filepath if neither exists
+
+    if os.path.exists(filepath):
+        return filepath
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(filepath + suffix):
+            return filepath + suffix
+
+    return filepath
+
+
+
+def is_archived(filepath):
+
+    #True if filepath (as returned by find_output) is a compressed file
+
+    return os.path.splitext(filepath)[1] in COMPRESSED_SUFFIXES
+
+
+
+def open_output(filepath, mode='r'):
+
+    #Open an output for reading, decompressing it on the fly if it has been archived
+    #mode: 'r' (text) or 'rb' (bytes)
+    #Tip: archived files can be read and seeked forward like plain ones, but seeking backwards restarts decompression
+
+    filepath = find_output(filepath)
+    suffix = os.path.splitext(filepath)[1]
+    text = mode == 'r'
+
+    if suffix == '.gz':
+        return gzip.open(filepath, 'rt' if text else 'rb')
+    elif suffix == '.xz':
+        return lzma.open(filepath, 'rt' if text else 'rb')
+    elif suffix == '.bz2':
+        return bz2.open(filepath, 'rt' if text else 'rb')
+    elif suffix == '.zst':
+        if zstandard == None:
+            raise ImportError('zstandard is needed to read ' + filepath)
+        return zstandard.open(filepath, 'rt' if text else 'rb')
+
+    return open(filepath, mode)
+
+
+
+def parse_xyz_comment(comment):
+
+    #Pull energy, frame number and constraint distance out of the comment line of an xyz frame
+    #terachem scan_optim.xyz: 'Converged' lines, energy as 5th and constraint distance as 7th item (in brackets)
+    #terachem optim.xyz and trajectories: energy in front of 'frame n'
+    #Items that are not found are None
+
+    fields = comment.split()
+    meta = {'comment': comment, 'energy': None, 'frame': None, 'distance': None}
+
+    if 'Converged' in comment and len(fields) > 6:
+        meta['energy'] = float(fields[4])
+        meta['distance'] = float(fields[6].replace('(','').replace(')',''))
+
+    if 'frame' in fields:
+        idx = fields.index('frame')
+        if idx + 1 < len(fields) and fields[idx+1].isdigit():
+            meta['frame'] = int(fields[idx+1])
+        if idx > 0 and meta['energy'] == None and fields[idx-1].lstrip('-').replace('.','',1).isdigit():
+            meta['energy'] = float(fields[idx-1])
+
+    return meta
+
+
+
+def read_xyz_frames(filepath):
+
+    #Read a multi-frame xyz file (scan_optim.xyz, optim.xyz, _trj.xyz...) straight into arrays
+    #A last frame that is still being written is left out
+    #Returns:
+    #symbols: list of element symbols
+    #coords: (nframes, natoms, 3) float array
+    #metas: list of dicts, one per frame (see parse_xyz_comment)
+
+    with open_output(filepath, 'r') as f:
+        text = f.read()
+    lines = text.splitlines()
+    if len(lines) == 0 or len(lines[0].split()) == 0:
+        return [], np.zeros((0, 0, 3)), []
+
+    #Each frame num lines: num_atoms + 2 header
+    natoms = int(lines[0].split()[0])
+    num_lines = natoms + 2
+    nframes = len(lines) // num_lines
+    if nframes > 0 and len(lines) == nframes * num_lines and text.endswith('\n') == False:
+        nframes -= 1 #last line of the last frame not finished yet
+    frames = np.array(lines[:nframes * num_lines], dtype=object).reshape(nframes, num_lines)
+
+    #Split all atom lines at once; if there are extra columns, only keep the first four of each line
+    body = frames[:, 2:].ravel()
+    tokens = ' '.join(body).split()
+    if len(tokens) == nframes * natoms * 4:
+        tokens = np.array(tokens, dtype=object).reshape(nframes, natoms, 4)
+    else:
+        tokens = np.array([line.split()[:4] for line in body], dtype=object).reshape(nframes, natoms, 4)
+
+    symbols = [str(sym) for sym in tokens[0, :, 0]] if nframes > 0 else []
+    coords = tokens[:, :, 1:].astype(float)
+    metas = [parse_xyz_comment(comment) for comment in frames[:, 1]]
+
+    return symbols, coords, metas
+
+
+
+def read_mol2_arrays(mol2):
+
+    #Element symbols and (natoms, 3) coordinate array of a mol2 string, without building a mol3D
+    #Element taken from the atom type (C.ar -> C)
+
+    lines = mol2.splitlines()
+    symbols, coords = [], []
+    for line in lines[lines.index('@<TRIPOS>ATOM') + 1:]:
+        if line.startswith('@<TRIPOS>'):
+            break
+        fields = line.split()
+        if len(fields) >= 6:
+            symbols.append(fields[5].split('.')[0])
+            coords.append(fields[2:5])
+
+    return symbols, np.array(coords, dtype=float).reshape(len(symbols), 3)
+
+
+
+def write_xyz_frame(filepath, symbols, coords, comment=''):
+
+    #Write a single frame (symbols and (natoms, 3) coordinates) into an xyz file
+
+    with open(filepath, 'w') as f:
+        f.write(str(len(symbols)) + '\n')
+        f.write(comment + '\n')
+        for sym, coord in zip(symbols, coords):
+            f.write('%s %.8f %.8f %.8f\n' % (sym, coord[0], coord[1], coord[2]))
+
+
+
+def _frame_offsets(data, natoms):
+
+    #Helper of index_xyz_frames: offsets (in data) of the beginning of every complete frame, and of the end of the last one
+    #Each frame num lines: num_atoms + 2 header; a frame is complete once its last line has ended
+
+    num_lines = natoms + 2
+    newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+    nframes = len(newlines) // num_lines
+    if nframes == 0:
+        return [], 0
+    starts = np.concatenate([[0], newlines[num_lines-1:(nframes-1)*num_lines:num_lines] + 1])
+
+    return starts.tolist(), int(newlines[nframes*num_lines-1]) + 1
+
+
+
+def index_xyz_frames(filepath):
+
+    #Build the byte offset index of the frames of a multi-frame xyz file, so that any frame can be read with one seek
+    #The index is kept next to the file (filepath.idx.json) and only the bytes appended since the last call are scanned
+    #It is rebuilt from scratch if the file shrank or its first line changed (file overwritten)
+    #Archived trajectories (see find_output) are complete: they are indexed in one pass over the decompressed bytes,
+    #and the index is kept as long as the archive keeps its size and mtime
+    #Returns a dict:
+    #natoms: number of atoms
+    #offsets: byte offset of the beginning of every complete frame
+    #end: byte offset right after the last complete frame
+    #torn: True if there are bytes after the last complete frame (xyz being written right now)
+
+    idxpath = filepath + '.idx.json'
+    path = find_output(filepath)
+    if is_archived(path):
+        stat = os.stat(path)
+        archive = [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+        if os.path.exists(idxpath):
+            with open(idxpath, 'r') as f:
+                index = json.load(f)
+            if index.get('archive') == archive:
+                return index
+        with open_output(path, 'rb') as f:
+            data = f.read()
+        head = data[:data.find(b'\n') + 1].decode()
+        if len(head.split()) == 0: #empty file
+            return {'natoms': 0, 'offsets': [], 'end': 0, 'torn': len(data) > 0}
+        index = {'head': head, 'natoms': int(head.split()[0]), 'archive': archive}
+        index['offsets'], index['end'] = _frame_offsets(data, index['natoms'])
+        index['torn'] = index['end'] < len(data)
+        with open(idxpath + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(idxpath + '.tmp', idxpath)
+        return index
+
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        head = f.readline().decode()
+
+    index = None
+    if os.path.exists(idxpath):
+        with open(idxpath, 'r') as f:
+            index = json.load(f)
+        if index['head'] != head or index['end'] > size or 'archive' in index:
+            index = None
+        elif len(index['offsets']) > 0: #last indexed frame should still begin where it used to
+            with open(filepath, 'rb') as f:
+                f.seek(index['offsets'][-1])
+                if f.readline().decode() != head:
+                    index = None
+    if index == None:
+        if len(head.split()) == 0: #empty file
+            return {'natoms': 0, 'offsets': [], 'end': 0, 'torn': size > 0}
+        index = {'head': head, 'natoms': int(head.split()[0]), 'offsets': [], 'end': 0}
+
+    if index['end'] < size:
+        with open(filepath, 'rb') as f:
+            f.seek(index['end'])
+            data = f.read(size - index['end'])
+
+        offsets, end = _frame_offsets(data, index['natoms'])
+        if len(offsets) > 0:
+            index['offsets'] += [offset + index['end'] for offset in offsets]
+            index['end'] += end
+            with open(idxpath + '.tmp', 'w') as f:
+                json.dump(index, f)
+            os.replace(idxpath + '.tmp', idxpath)
+
+    index['torn'] = index['end'] < size
+
+    return index
+
+
+
+def count_xyz_frames(filepath):
+
+    #Number of complete frames of a multi-frame xyz file (see index_xyz_frames)
+
+    return len(index_xyz_frames(filepath)['offsets'])
+
+
+
+def read_xyz_frame(filepath, n, index=None):
+
+    #Read only the nth frame (starting with 0, negative counts from the end) of a multi-frame xyz file
+    #index: index_xyz_frames result, if already at hand
+    #Returns symbols, (natoms, 3) coordinate array, meta (see parse_xyz_comment)
+
+    if index == None:
+        index = index_xyz_frames(filepath)
+    offsets = index['offsets'] + [index['end']]
+    n = range(len(index['offsets']))[n] #raises IndexError if out of range
+
+    with open_output(filepath, 'rb') as f:
+        f.seek(offsets[n])
+        lines = f.read(offsets[n+1] - offsets[n]).decode().splitlines()
+
+    rows = [line.split()[:4] for line in lines[2:]]
+    symbols = [row[0] for row in rows]
+    coords = np.array([row[1:] for row in rows], dtype=float)
+
+    return symbols, coords, parse_xyz_comment(lines[1])
+
+
+
+def archive_file(filepath, fmt='gz'):
+
+    #Compress filepath into filepath.gz/.xz/.bz2/.zst (keeping its mtime) and remove the original
+    #The archive is written under a temporary name first, so a crash never leaves a half-written archive behind
+    #Returns the path of the archive
+
+    archivepath = filepath + '.' + fmt
+    with open(filepath, 'rb') as fin:
+        if fmt == 'gz':
+            fout = gzip.open(archivepath + '.tmp', 'wb', compresslevel=6)
+        elif fmt == 'xz':
+            fout = lzma.open(archivepath + '.tmp', 'wb')
+        elif fmt == 'bz2':
+            fout = bz2.open(archivepath + '.tmp', 'wb')
+        elif fmt == 'zst':
+            if zstandard == None:
+                raise ImportError('zstandard is needed to write ' + archivepath)
+            fout = zstandard.open(archivepath + '.tmp', 'wb')
+        else:
+            raise ValueError('Unknown archive format ' + fmt)
+        with fout:
+            shutil.copyfileobj(fin, fout, 1 << 20)
+    shutil.copystat(filepath, archivepath + '.tmp')
+    os.replace(archivepath + '.tmp', archivepath)
+    os.remove(filepath)
+
+    return archivepath
+
+
+
+def job_finished(dirpath, tail_bytes=16384):
+
+    #True if the job of folder X (dirpath) has finished: the end of X/X.out holds an orca or terachem termination message
+    #Jobs killed by walltime never print one, pass force to archive_jobs for those
+
+    outpath = dirpath.rstrip('/') + '/' + os.path.basename(dirpath.rstrip('/')) + '.out'
+    if os.path.exists(outpath) == False:
+        return False
+
+    size = os.path.getsize(outpath)
+    with open(outpath, 'rb') as f:
+        f.seek(max(0, size - tail_bytes))
+        tail = f.read().decode('utf-8', errors='replace')
+    for message in ['ORCA TERMINATED NORMALLY', 'error termination', 'aborting the run', 'Job finished', 'DIE called']:
+        if message in tail:
+            return True
+
+    return False
+
+
+
+def archive_jobs(dirpaths, fmt='gz', suffixes=('.out', '.xyz'), force=False):
+
+    #Archive the outputs of finished job folders X: X/X.out, and the outputs and trajectories of X/scr (files ending
+    #with suffixes, subfolders included)
+    #Inputs next to X.out (X.in, the input geometry X.xyz...) are left as they are, restarts such as continue_COGEF
+    #read them with plain open()
+    #Folders whose job has not finished (see job_finished) are skipped unless force
+    #Index sidecars (.idx.json) of archived trajectories are dropped, they are rebuilt on the next read
+    #Returns the list of archives written
+
+    archived = []
+    for dirpath in dirpaths:
+        if os.path.isdir(dirpath) == False or (force == False and job_finished(dirpath) == False):
+            continue
+        outpath = dirpath.rstrip('/') + '/' + os.path.basename(dirpath.rstrip('/')) + '.out'
+        filepaths = [outpath] if os.path.exists(outpath) else []
+        for root, dirs, files in os.walk(os.path.join(dirpath, 'scr')):
+            filepaths += [os.path.join(root, name) for name in sorted(files) if name.endswith(tuple(suffixes))]
+        for filepath in filepaths:
+            archived.append(archive_file(filepath, fmt))
+            if os.path.exists(filepath + '.idx.json'):
+                os.remove(filepath + '.idx.json')
+
+    return archived
+
+
+
+if __name__ == '__main__':
+
+    #Archive command, e.g. to compress every finished job folder of a campaign with xz:
+    #python io_tools.py archive --xz campaign/*/
+    #Options: --gz (default), --xz, --bz2, --zst; --force to also archive unfinished (e.g. walltime-killed) jobs
+
+    args = sys.argv[1:]
+    if len(args) == 0 or args[0] != 'archive':
+        sys.exit('usage: python io_tools.py archive [--gz|--xz|--bz2|--zst] [--force] jobdir [jobdir ...]')
+    fmt, force, dirpaths = 'gz', False, []
+    for arg in args[1:]:
+        if arg == '--force':
+            force = True
+        elif arg.startswith('--'):
+            fmt = arg[2:]
+        else:
+            dirpaths.append(arg)
+
+    archived = archive_jobs(dirpaths, fmt=fmt, force=force)
+    print(str(len(archived)) + ' files archived')
@@ -0,0 +1,111 @@
+import os
+import time
+import zlib
+import pickle
+import sqlite3
+
+
+
+#Persistent cache of parsed job outputs, so that re-harvesting a campaign only re-parses the files that changed
+#A result is stored in a local SQLite file under (function, arguments, version) together with the (path, size, mtime)
+#of the files it was parsed from; it is reused as long as none of these files changed and the version is the same
+#Bump version when a parser starts returning something different, older entries are then ignored and evicted
+#The least recently used entries are evicted once the cache grows over max_bytes
+#Tip: keep the cache file on a local disk, not next to the job folders on a shared file system
+
+
+
+def _connect(cachepath):
+
+    #Open (and create if needed) a cache file; the timeout lets parallel workers wait for each other's writes
+
+    con = sqlite3.connect(cachepath, timeout=60)
+    con.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, stamp TEXT, value BLOB, nbytes INTEGER, '
+                'last_used REAL)')
+    con.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+
+    return con
+
+
+
+def file_stamp(filepaths):
+
+    #[path, size, mtime] of every file a result depends on; missing files are recorded as such
+    #so that a result computed before a file appeared is not reused afterwards
+
+    if type(filepaths) == str:
+        filepaths = [filepaths]
+    stamp = []
+    for filepath in filepaths:
+        filepath = os.path.abspath(filepath)
+        if os.path.exists(filepath):
+            stat = os.stat(filepath)
+            stamp.append([filepath, stat.st_size, stat.st_mtime_ns])
+        else:
+            stamp.append([filepath, None, None])
+
+    return stamp
+
+
+
+def cached_call(filepaths, func, args=(), cachepath='parse_cache.sqlite', version=1, max_bytes=2**29):
+
+    #Return func(*args), reusing the stored result if the files in filepaths have not changed since it was computed
+    #filepaths: path or list of paths of the files the result is parsed from
+    #func: parsing function; its name, args and version make the key, so args should have a stable repr
+    #cachepath: SQLite cache file
+    #version: version of func's results, part of the key; callers keep it in a module-level constant (e.g.
+    #SCAN_OPTIM_VERSION) to be bumped whenever func changes the shape of what it returns, so old results are not served
+    #max_bytes: size bound of the stored (compressed) results, least recently used ones are evicted above it
+
+    stamp = file_stamp(filepaths)
+    key = repr([func.__name__, args, version, [path for path, size, mtime in stamp]]) #paths: same args, other folder
+
+    con = _connect(cachepath)
+    row = con.execute('SELECT stamp, value FROM results WHERE key = ?', (key,)).fetchone()
+    if row != None and row[0] == repr(stamp):
+        con.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        con.commit()
+        con.close()
+        return pickle.loads(zlib.decompress(row[1]))
+
+    result = func(*args)
+    if file_stamp(filepaths) == stamp: #do not store results of files that changed while being parsed
+        value = zlib.compress(pickle.dumps(result))
+        con.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', (key, repr(stamp), value, len(value),
+                                                                          time.time()))
+        evict(con, max_bytes)
+        con.commit()
+    con.close()
+
+    return result
+
+
+
+def evict(con, max_bytes):
+
+    #Delete the least recently used results until the stored ones fit into max_bytes
+
+    total = con.execute('SELECT COALESCE(SUM(nbytes), 0) FROM results').fetchone()[0]
+    if total <= max_bytes:
+        return
+    for key, nbytes in con.execute('SELECT key, nbytes FROM results ORDER BY last_used').fetchall():
+        con.execute('DELETE FROM results WHERE key = ?', (key,))
+        total -= nbytes
+        if total <= max_bytes:
+            break
+
+
+
+def clear_cache(cachepath='parse_cache.sqlite', func=None):
+
+    #Drop every stored result, or only those of one parsing function (e.g. after changing it without bumping version)
+
+    con = _connect(cachepath)
+    if func == None:
+        con.execute('DELETE FROM results')
+    else:
+        con.execute('DELETE FROM results WHERE key LIKE ?', ("['" + func.__name__ + "',%",))
+    con.commit()
+    con.execute('VACUUM')
+    con.close()
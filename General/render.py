@@ -0,0 +1,129 @@
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+
+
+#Headless batch rendering of campaign figures
+#A figure is a plotting function (e.g. plot_nsteps_vs_dist, analyze_aismd_traj, plot_Ehsls) called with its inputs
+#and savepath=..., show=False; figures are drawn on the Agg backend (no display needed) in worker processes and
+#written as png/svg files
+#A manifest in the output folder keeps the hash of the inputs of every figure written, so that a figure is only drawn
+#again once its inputs changed (input files are hashed through their size and mtime, not their content)
+#Tip: plotting functions must be defined at the top level of a module or notebook (worker processes are forked)
+
+
+
+def finish_figure(fig=None, savepath=None, show=True):
+
+    #End of every plotting function: write the figure to savepath (if given), then show it or close it
+    #fig: figure to finish, default the current one
+
+    if fig == None:
+        fig = plt.gcf()
+    if savepath != None:
+        fig.savefig(savepath, bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+
+
+
+def input_hash(func, args=(), kwargs=None):
+
+    #Hash of a figure: plotting function name and inputs; string inputs naming an existing file also bring in its
+    #size and mtime, so that figures of files that changed are drawn again
+
+    stamps = []
+    for arg in list(args) + list((kwargs or {}).values()):
+        if type(arg) == str and os.path.isfile(arg):
+            stat = os.stat(arg)
+            stamps.append([arg, stat.st_size, stat.st_mtime_ns])
+    key = pickle.dumps([func.__module__, func.__name__, args, kwargs, stamps], protocol=4)
+
+    return hashlib.sha1(key).hexdigest()
+
+
+
+def _init_worker():
+
+    #Worker processes draw on the Agg backend, whatever backend the parent uses
+
+    plt.switch_backend('Agg')
+
+
+
+def _render_job(job):
+
+    #Helper of render_figures (run in worker processes): draw one figure, returns an error message or None
+
+    func, args, kwargs, savepath = job
+    try:
+        func(*args, savepath=savepath, show=False, **kwargs)
+    except Exception as error:
+        plt.close('all')
+        return type(error).__name__ + ': ' + str(error)
+
+    return None
+
+
+
+def render_figures(figures, outdir='figures', fmt='png', nprocs=None, force=False):
+
+    #Draw a batch of figures in parallel, skipping those whose inputs did not change since they were written
+    #Inputs:
+    #figures: list of (name, func, args) or (name, func, args, kwargs); the figure is written to outdir/name.fmt by
+    #func(*args, savepath=..., show=False, **kwargs)
+    #outdir: output folder, holding the manifest (render_manifest.json) as well
+    #fmt: 'png' or 'svg'
+    #nprocs: number of worker processes (default: all cores)
+    #force: draw every figure again
+    #Output:
+    #DataFrame, one row per figure: name, path, status ('rendered', 'skipped' or 'Failed') and error
+    #Example: render_figures([(name, analyze_aismd_traj, (name + '/scr/coors.xyz', name)) for name in names])
+
+    if os.path.exists(outdir) == False:
+        os.makedirs(outdir)
+    manifestpath = outdir + '/render_manifest.json'
+    manifest = {}
+    if os.path.exists(manifestpath):
+        with open(manifestpath, 'r') as f:
+            manifest = json.load(f)
+
+    rows, jobs, hashes = [], [], []
+    for figure in figures:
+        name, func, args = figure[:3]
+        kwargs = figure[3] if len(figure) > 3 else {}
+        savepath = outdir + '/' + name + '.' + fmt
+        figure_hash = input_hash(func, args, kwargs)
+        row = {'name': name, 'path': savepath, 'status': 'skipped', 'error': None}
+        if force or manifest.get(name + '.' + fmt) != figure_hash or os.path.exists(savepath) == False:
+            row['status'] = 'rendered'
+            jobs.append((func, args, kwargs, savepath))
+            hashes.append((len(rows), figure_hash))
+        rows.append(row)
+
+    if len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=nprocs, initializer=_init_worker) as pool:
+            errors = list(pool.map(_render_job, jobs))
+        for (idx, figure_hash), error in zip(hashes, errors):
+            key = rows[idx]['name'] + '.' + fmt
+            if error == None:
+                manifest[key] = figure_hash
+            else:
+                rows[idx]['status'], rows[idx]['error'] = 'Failed', error
+                manifest.pop(key, None)
+        with open(manifestpath + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifestpath + '.tmp', manifestpath)
+
+    df = pd.DataFrame(rows, columns=['name', 'path', 'status', 'error'])
+    counts = df['status'].value_counts()
+    print(', '.join(str(counts.get(status, 0)) + ' ' + status for status in ['rendered', 'skipped', 'Failed']))
+
+    return df
@@ -0,0 +1,460 @@
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from collections import OrderedDict
+from molSimplify.Classes.ligand import ligand_breakdown
+try:
+    from io_tools import read_mol2_arrays #imported as a module (stand-alone scripts): io_tools.py sits next to it
+    from tools import mol3D_from_arrays
+except ImportError:
+    pass #notebooks run General/io_tools.py and General/tools.py in the same namespace
+
+
+
+#Array-based structure analysis: quantities that used to be obtained by building a mol3D per frame
+#(ligand_breakdown, getBondedAtoms...) are obtained for all frames of a trajectory at once with numpy
+
+#Covalent radii (in A, Cordero et al. 2008; high spin values for Mn, Fe, Co)
+COVALENT_RADII = {'H': 0.31, 'B': 0.84, 'C': 0.76, 'N': 0.71, 'O': 0.66, 'F': 0.57, 'Si': 1.11, 'P': 1.07, 'S': 1.05,
+                  'Cl': 1.02, 'As': 1.19, 'Se': 1.20, 'Br': 1.20, 'I': 1.39,
+                  'Ti': 1.60, 'V': 1.53, 'Cr': 1.39, 'Mn': 1.61, 'Fe': 1.52, 'Co': 1.50, 'Ni': 1.24, 'Cu': 1.32,
+                  'Zn': 1.22, 'Ru': 1.46, 'Rh': 1.42, 'Pd': 1.39}
+METALS = ['Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ru', 'Rh', 'Pd']
+
+
+
+def covalent_radii(symbols):
+
+    #Array of covalent radii of the atoms (1.5 A for unlisted elements)
+
+    return np.array([COVALENT_RADII.get(sym, 1.5) for sym in symbols])
+
+
+
+#Offsets of a cell and its 26 neighbours
+CELL_OFFSETS = np.array([[i, j, k] for i in [-1, 0, 1] for j in [-1, 0, 1] for k in [-1, 0, 1]])
+
+
+
+def neighbor_pairs(coords, cutoff):
+
+    #All pairs of atoms closer than cutoff, found with a cell list instead of all-pairs distances
+    #Atoms are binned into cubic cells of side cutoff, so partners of an atom can only sit in its own or the 26
+    #neighbouring cells; the work grows linearly with the number of atoms
+    #Returns i, j (i < j) and their distances
+
+    coords = np.asarray(coords, dtype=float)
+    natoms = len(coords)
+    cells = np.floor((coords - coords.min(axis=0)) / cutoff).astype(np.int64) + 1 #+1: neighbours of border cells >= 0
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    iis, jjs = [], []
+    for offset in CELL_OFFSETS:
+        neighbor_keys = keys + (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+        lo = np.searchsorted(sorted_keys, neighbor_keys, 'left')
+        counts = np.searchsorted(sorted_keys, neighbor_keys, 'right') - lo
+        ii = np.repeat(np.arange(natoms), counts)
+        jj = order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        iis.append(ii[ii < jj])
+        jjs.append(jj[ii < jj])
+    ii, jj = np.concatenate(iis), np.concatenate(jjs)
+    dists = np.linalg.norm(coords[ii] - coords[jj], axis=1)
+    close = dists < cutoff
+
+    return ii[close], jj[close], dists[close]
+
+
+
+def bond_pairs(symbols, coords, factor=1.2):
+
+    #Bonded pairs of atoms: closer than factor times the sum of their covalent radii (see neighbor_pairs)
+    #Returns i, j (i < j)
+
+    radii = covalent_radii(symbols)
+    ii, jj, dists = neighbor_pairs(coords, factor * 2 * radii.max())
+    bonded = dists < factor * (radii[ii] + radii[jj])
+
+    return ii[bonded], jj[bonded]
+
+
+
+def iter_bond_pairs(symbols, frames, factor=1.2, skin=0.4):
+
+    #Bonded pairs (i, j arrays, see bond_pairs) of every frame of a trajectory, updated frame by frame
+    #Verlet list: candidate pairs are the ones within cutoff + skin, found once with a cell list; each frame then only
+    #measures the candidates, which are all pairs near the threshold. Candidates are searched again only when an atom
+    #has moved more than skin / 2 since the last search, since only then may a pair from outside the list have come
+    #within the cutoff
+    #frames: (nframes, natoms, 3) array (e.g. a memory-mapped trajectory, see load_traj_cache in Terachem/aismd.py)
+
+    radii = covalent_radii(symbols)
+    reference = None
+    for coords in frames:
+        coords = np.asarray(coords, dtype=float)
+        if reference is None or np.linalg.norm(coords - reference, axis=1).max() > skin / 2:
+            reference = coords
+            ii, jj, dists = neighbor_pairs(coords, factor * 2 * radii.max() + skin)
+            near = dists < factor * (radii[ii] + radii[jj]) + skin
+            ii, jj = ii[near], jj[near]
+            cutoffs = factor * (radii[ii] + radii[jj])
+        bonded = np.linalg.norm(coords[ii] - coords[jj], axis=1) < cutoffs
+        yield ii[bonded], jj[bonded]
+
+
+
+def bond_events(symbols, frames, factor=1.2, skin=0.4):
+
+    #Bonds formed and broken along a trajectory, relative to the first frame's bond graph and then frame to frame
+    #Returns list of (frame number, formed pairs, broken pairs), only for frames where the bond graph changed
+
+    events = []
+    previous = None
+    for n, (ii, jj) in enumerate(iter_bond_pairs(symbols, frames, factor, skin)):
+        current = set(zip(ii.tolist(), jj.tolist()))
+        if previous != None and current != previous:
+            events.append((n, sorted(current - previous), sorted(previous - current)))
+        previous = current
+
+    return events
+
+
+
+def find_coordination(symbols, coords, factor=1.2):
+
+    #Identify metal, donor atoms and the ligand each donor belongs to, from a reference (intact) frame
+    #Ligands are the connected components of the bond graph without the metal
+    #Returns a dict:
+    #metal: index of the (first) metal atom
+    #donors: indexes of the atoms bonded to the metal
+    #ligands: ligand number of each donor (0, 1... in order of their first donor)
+    #cutoffs: metal-donor bond cutoff of each donor
+    #lengths: metal-donor bond length of each donor in the reference frame
+    #elements: element of each donor
+    #pattern: denticity of each ligand in the reference frame, e.g. [3, 3]
+
+    coords = np.asarray(coords, dtype=float)
+    metal = [i for i, sym in enumerate(symbols) if sym in METALS][0]
+    ii, jj = bond_pairs(symbols, coords, factor)
+    donors = np.sort(np.concatenate([jj[ii == metal], ii[jj == metal]]))
+
+    #Connected components of the organic part, grown from each donor
+    neighbors = [[] for sym in symbols]
+    for i, j in zip(ii.tolist(), jj.tolist()):
+        if i != metal and j != metal:
+            neighbors[i].append(j)
+            neighbors[j].append(i)
+    component = np.full(len(symbols), -1)
+    nligands = 0
+    for donor in donors:
+        if component[donor] == -1:
+            component[donor] = nligands
+            stack = [donor]
+            while len(stack) > 0:
+                for neighbor in neighbors[stack.pop()]:
+                    if component[neighbor] == -1:
+                        component[neighbor] = nligands
+                        stack.append(neighbor)
+            nligands += 1
+    ligands = component[donors]
+
+    radii = covalent_radii(symbols)
+    return {'metal': metal, 'donors': donors, 'ligands': ligands, 'cutoffs': factor * (radii[metal] + radii[donors]),
+            'lengths': np.linalg.norm(coords[donors] - coords[metal], axis=1),
+            'elements': [symbols[donor] for donor in donors],
+            'pattern': np.bincount(ligands, minlength=nligands).tolist()}
+
+
+
+def denticity_frames(coordination, frames):
+
+    #Number of donors of each ligand still bonded to the metal, for every frame at once
+    #coordination: find_coordination result; frames: (nframes, natoms, 3) array
+    #Returns (nframes, nligands) integer array
+    #Tip: only donors of the reference frame are followed, atoms binding the metal later on are not counted
+
+    frames = np.asarray(frames, dtype=float)
+    dists = np.linalg.norm(frames[:, coordination['donors'], :] - frames[:, [coordination['metal']], :], axis=2)
+    bonded = dists < coordination['cutoffs']
+    onehot = np.eye(len(coordination['pattern']), dtype=int)[coordination['ligands']] #(ndonors, nligands)
+
+    return bonded.astype(int) @ onehot
+
+
+
+def donor_thresholds(coordination, bond_threshold):
+
+    #Bond breaking threshold (ratio to the reference length) of each donor
+    #bond_threshold: one ratio for all donors, or a dict giving ratios per donor atom index or per element
+    #(e.g. {'O': 1.4, 'N': 1.5}); donors missing from the dict get 1.5
+
+    if type(bond_threshold) != dict:
+        return np.full(len(coordination['donors']), float(bond_threshold))
+
+    return np.array([bond_threshold.get(int(donor), bond_threshold.get(element, 1.5))
+                     for donor, element in zip(coordination['donors'], coordination['elements'])], dtype=float)
+
+
+
+def frame_states(coordination, frames, bond_threshold=1.5, angle_tolerance=25):
+
+    #Structural state of every frame at once, relative to the reference frame of coordination (see find_coordination)
+    #This is where all "is it still intact" criteria are decided (see file_states for the cached version)
+    #Returns a DataFrame, one row per frame:
+    #cn: number of donors still bonded to the metal (within the covalent cutoff)
+    #broken: donors whose bond to the metal became longer than bond_threshold * its reference length
+    #(bond_threshold: a ratio, or per donor / per element ratios, see donor_thresholds)
+    #nbroken: number of broken donors
+    #denticity: donors still bonded of each ligand, e.g. [3, 2]
+    #nligands: number of ligands still bonded
+    #intact: denticity equal to the reference pattern
+    #octahedral: six bonded donors, cis angles within angle_tolerance of 90 and trans angles within twice that of 180
+
+    frames = np.asarray(frames, dtype=float).reshape(-1, np.shape(frames)[-2], 3)
+    donors = coordination['donors']
+    vectors = frames[:, donors, :] - frames[:, [coordination['metal']], :]
+    dists = np.linalg.norm(vectors, axis=2)
+    bonded = dists < coordination['cutoffs']
+    broken = dists > donor_thresholds(coordination, bond_threshold) * coordination['lengths']
+    onehot = np.eye(len(coordination['pattern']), dtype=int)[coordination['ligands']] #(ndonors, nligands)
+    dents = bonded.astype(int) @ onehot
+
+    octahedral = np.zeros(len(frames), dtype=bool)
+    if len(donors) == 6:
+        units = vectors / dists[:, :, None]
+        angles = np.sort(np.degrees(np.arccos(np.clip(np.einsum('fik,fjk->fij', units, units), -1, 1))), axis=2)
+        cis, trans = angles[:, :, 1:5], angles[:, :, 5] #[:, :, 0]: angle of each donor with itself
+        octahedral = bonded.all(axis=1) & (np.abs(cis - 90) < angle_tolerance).all(axis=(1, 2)) & \
+                     (trans > 180 - 2 * angle_tolerance).all(axis=1)
+
+    return pd.DataFrame({'cn': bonded.sum(axis=1), 'broken': [donors[row].tolist() for row in broken],
+                         'nbroken': broken.sum(axis=1), 'denticity': dents.tolist(),
+                         'nligands': (dents > 0).sum(axis=1),
+                         'intact': (dents == np.array(coordination['pattern'])).all(axis=1),
+                         'octahedral': octahedral})
+
+
+
+#Structural states already computed, per (file, settings): {frame number: (coordinate digest, state)}
+#Least recently used files are dropped once more than MAX_STATE_FRAMES frames are kept (see _evict_states)
+_STATES = OrderedDict()
+MAX_STATE_FRAMES = 200000
+STATE_COLUMNS = ['cn', 'broken', 'nbroken', 'denticity', 'nligands', 'intact', 'octahedral']
+
+
+
+def _frame_digest(coords):
+
+    #Helper of file_states: short digest of a frame's coordinates (rounded to 1e-4 A)
+
+    return hashlib.sha1((np.round(np.asarray(coords, dtype=float), 4) + 0.0).tobytes()).hexdigest()[:16]
+
+
+
+def _evict_states(max_frames=None):
+
+    #Helper of file_states: forget the states of the least recently used files until at most max_frames frames
+    #(default MAX_STATE_FRAMES) are kept in memory; the file used last is always kept
+
+    if max_frames == None:
+        max_frames = MAX_STATE_FRAMES
+    total = sum(len(stored) for stored in _STATES.values())
+    while total > max_frames and len(_STATES) > 1:
+        key, stored = _STATES.popitem(last=False)
+        total -= len(stored)
+
+
+
+def file_states(filepath, symbols, frames, reference=None, first=0, cachepath=None, factor=1.2, bond_threshold=1.5,
+                angle_tolerance=25, order=None, stop=None):
+
+    #frame_states of the frames of a file, computed once per (file, frame)
+    #Each frame is recognized by a digest of its coordinates, so when a trajectory grows only the new frames are
+    #analyzed, and a frame analyzed for EFEI harvesting is not analyzed again for plotting or curation
+    #filepath: file the frames were read from (scan_optim.xyz, optim.xyz, .out...), only used as key
+    #reference: reference (intact) geometry, default the first frame
+    #first: number of the first frame given, when only the last frames of the file are passed (reference then needed)
+    #cachepath: SQLite file to also keep the states between sessions (default: this session only)
+    #In memory, the states of the least recently used files are dropped beyond MAX_STATE_FRAMES frames
+    #order: positions in frames to analyze, in this order (e.g. newest_first(len(frames))), default all of them
+    #stop: function of the position and state (dict) of a frame; frames are then analyzed one at a time and the
+    #analysis ends at the first frame for which it returns True (early exit, see all_dissociated)
+    #Returns the frame_states DataFrame of the frames analyzed, in order
+
+    frames = np.asarray(frames, dtype=float)
+    if reference is None:
+        reference = frames[0]
+    thresholds = sorted(bond_threshold.items(), key=str) if type(bond_threshold) == dict else bond_threshold
+    setting = repr([factor, thresholds, angle_tolerance, _frame_digest(reference)])
+    path = os.path.abspath(filepath)
+    stored = _STATES.pop((path, setting), {})
+    _STATES[(path, setting)] = stored #most recently used last
+
+    con = None
+    if cachepath != None:
+        con = sqlite3.connect(cachepath, timeout=60)
+        con.execute('CREATE TABLE IF NOT EXISTS states (path TEXT, setting TEXT, frame INTEGER, digest TEXT, '
+                    'state TEXT, PRIMARY KEY (path, setting, frame))')
+        if len(stored) == 0:
+            for frame, framedigest, state in con.execute('SELECT frame, digest, state FROM states WHERE path = ? '
+                                                         'AND setting = ?', (path, setting)):
+                stored[frame] = (framedigest, json.loads(state))
+
+    if order is None:
+        order = range(len(frames))
+    batches = [list(order)] if stop == None else [[i] for i in order] #all missing frames at once unless early exit
+    coordination, rows, analyzed = None, [], []
+    for batch in batches:
+        digests = {i: _frame_digest(frames[i]) for i in batch}
+        missing = [i for i in batch if first + i not in stored or stored[first + i][0] != digests[i]]
+        if len(missing) > 0:
+            if coordination == None:
+                coordination = find_coordination(symbols, reference, factor)
+            states = frame_states(coordination, frames[missing], bond_threshold, angle_tolerance)
+            for i, state in zip(missing, states.to_dict('records')):
+                state = json.loads(json.dumps(state, default=lambda value: value.item())) #numpy scalars -> python
+                stored[first + i] = (digests[i], state)
+                rows.append((path, setting, first + i, digests[i], json.dumps(state)))
+        analyzed.extend(batch)
+        if stop != None and stop(batch[0], stored[first + batch[0]][1]):
+            break
+    if con != None:
+        if len(rows) > 0:
+            con.executemany('INSERT OR REPLACE INTO states VALUES (?, ?, ?, ?, ?)', rows)
+            con.commit()
+        con.close()
+    numbers = [first + i for i in analyzed]
+    result = pd.DataFrame([stored[n][1] for n in numbers], columns=STATE_COLUMNS, index=numbers)
+    _evict_states()
+
+    return result
+
+
+
+@lru_cache(maxsize=4096)
+def geometry_state(mol2, factor=1.2, angle_tolerance=25):
+
+    #Structural state (see frame_states) of a single geometry given as mol2 string, its own reference
+    #(denticity is then the ligand pattern of the geometry itself, e.g. [3, 3] or [3, 2])
+    #Each geometry is analyzed once per session, however many curation or plotting passes look at it
+    #Returns a dict; Tip: it is shared between callers, do not modify it in place
+    #dependency: read_mol2_arrays (General/io_tools.py)
+
+    symbols, coords = read_mol2_arrays(mol2)
+    states = frame_states(find_coordination(symbols, coords, factor), [coords], angle_tolerance=angle_tolerance)
+
+    return states.to_dict('records')[0]
+
+
+
+def first_break(states):
+
+    #First frame (index of states) where a donor bond is broken, and the donors broken there; None, [] if none broke
+
+    broken = states.index[states['nbroken'] > 0]
+    if len(broken) == 0:
+        return None, []
+
+    return int(broken[0]), states.loc[broken[0], 'broken']
+
+
+
+def dissociation_verdicts(states, check_geom_shift=True):
+
+    #Boolean array, True for the frames (rows of frame_states / file_states) considered dissociated
+    #check_geom_shift = True: any change of the denticity pattern (e.g. [3,3] -> [3,2]) counts as dissociation
+    #check_geom_shift = False: only when fewer than two ligands stay bonded
+
+    if check_geom_shift:
+        return (states['intact'] == False).values
+    return (states['nligands'] < 2).values
+
+
+
+def frame_check(symbols, coords, coordination, check_geom_shift=True, confirm=False):
+
+    #Judge a single frame ((natoms, 3) array): 'intact' or 'diss', see dissociation_checks
+
+    flag = dissociation_verdicts(frame_states(coordination, [coords]), check_geom_shift)[0]
+
+    if flag and confirm:
+        l1,l2,l3 = ligand_breakdown(mol3D_from_arrays(symbols, coords))
+        if (check_geom_shift and sorted(l2) == sorted(coordination['pattern'])) or \
+           (check_geom_shift == False and len(l2) >= 2):
+            flag = False
+
+    return 'diss' if flag else 'intact'
+
+
+
+def dissociation_checks(symbols, frames, coordination, check_geom_shift=True, confirm=False, states=None):
+
+    #Judge for every frame whether the complex has dissociated, as ligand_breakdown based checks did
+    #(see dissociation_verdicts for the criteria)
+    #confirm: run ligand_breakdown on the frames flagged as dissociated, and keep only the flags it agrees with
+    #states: their frame_states, if already at hand (e.g. from file_states)
+    #Returns list of 'intact'/'diss' and the (nframes, nligands) denticity array
+    #dependency: mol3D_from_arrays (General/tools.py)
+
+    if states is None:
+        states = frame_states(coordination, frames)
+    flags = dissociation_verdicts(states, check_geom_shift)
+
+    checks = []
+    for i, flag in enumerate(flags):
+        check = 'diss' if flag else 'intact'
+        if flag and confirm:
+            check = frame_check(symbols, frames[i], coordination, check_geom_shift, confirm)
+        checks.append(check)
+
+    return checks, np.array(states['denticity'].tolist(), dtype=int).reshape(len(states), -1)
+
+
+
+def newest_first(nframes, stride=1):
+
+    #Order in which to check frames 0..nframes-1 when looking for an intact one: newest first, since a job that has
+    #dissociated stays dissociated; with stride > 1 a coarse pass over every stride-th frame comes first, then the rest
+
+    coarse = list(range(nframes-1, -1, -stride))
+    rest = [i for i in range(nframes-1, -1, -1) if i % stride != (nframes-1) % stride]
+
+    return coarse + rest
+
+
+
+def all_dissociated(symbols, frames, coordination, check_geom_shift=True, confirm=False, stride=1, filepath=None,
+                    reference=None, first=0):
+
+    #True if every frame has dissociated (see dissociation_checks), stopping at the first intact frame found
+    #frames: (nframes, natoms, 3) array, or list of frames
+    #For a healthy job this is a single frame check (the newest one)
+    #filepath: file the frames were read from; their states are then taken from (and added to) the memo of
+    #file_states, so repeated checks of a growing file only analyze the new frames; reference, first: see file_states
+
+    if filepath == None:
+        for i in newest_first(len(frames), stride):
+            if frame_check(symbols, frames[i], coordination, check_geom_shift, confirm) == 'intact':
+                return False
+        return True
+
+    intact = []
+
+    def is_intact(i, state):
+        check = 'diss' if dissociation_verdicts(pd.DataFrame([state]), check_geom_shift)[0] else 'intact'
+        if check == 'diss' and confirm:
+            check = frame_check(symbols, frames[i], coordination, check_geom_shift, confirm)
+        if check == 'intact':
+            intact.append(i)
+        return check == 'intact'
+
+    file_states(filepath, symbols, frames, reference=reference, first=first, order=newest_first(len(frames), stride),
+                stop=is_intact)
+
+    return len(intact) == 0
@@ -2,6 +2,31 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from molSimplify.Classes.mol3D import mol3D
+from molSimplify.Classes.atom3D import atom3D
+
+
+
+def mol3D_from_arrays(symbols,coords):
+
+    #Build a mol3D from a list of element symbols and a (natoms, 3) coordinate array
+    #Nothing is written to disk, so it is safe to use from several analyses running in the same directory
+
+    mol = mol3D()
+    for sym,coord in zip(symbols,coords):
+        mol.addAtom(atom3D(str(sym),[float(coord[0]),float(coord[1]),float(coord[2])]))
+
+    return mol
+
+
+
+def mol2_from_arrays(symbols,coords,name='mol'):
+
+    #Return the mol2 string of the molecule given by element symbols and a (natoms, 3) coordinate array
+    #writemol2 with writestring only returns the string, nothing is written to disk
+
+    mol = mol3D_from_arrays(symbols,coords)
+
+    return mol.writemol2(name,writestring = True)
 
 
 
@@ -11,22 +36,14 @@ def atom_func(mol,idxs,eles):
     #idxs: list of idxs to be modified, start with 0
     #eles: list of elements to be changed into
 
-    mol.writexyz('temp.xyz',symbsonly=True)
-    f = open('temp.xyz','r')
-    lines = f.readlines()
+    symbols = [atom.symbol() for atom in mol.getAtoms()]
+    coords = mol.coordsvect()
 
     for i in np.arange(len(idxs)):
         idx,ele = idxs[i],eles[i]
-        line = lines[idx+2] #First two lines are placeholders
-        linel = line.split()
-        linenew = ele + ' ' + linel[1] + ' ' + linel[2] + ' ' + linel[3] + '\n'
-        lines[idx+2] = linenew
+        symbols[idx] = ele
 
-    with open('tempnew.xyz','w') as fnew:
-        fnew.writelines(lines)
-
-    molnew = mol3D()
-    molnew.readfromxyz('tempnew.xyz')
+    molnew = mol3D_from_arrays(symbols,coords)
 
     return molnew
 
@@ -63,24 +80,16 @@ def oct_check(df,lsname,isname,hsname):
     
     #Return number of oct and non-oct geometry of hs , (is) and ls: [lso,lsno] , ([iso,isno]), [hso,hsno] 
     #For Co2+: set isname to None
+    #Octahedrality from the shared structural-state engine (each geometry analyzed once per session)
+    #dependency: geometry_state (General/structure_tools.py)
     lso,lsno,iso,isno,hso,hsno = 0,0,0,0,0,0
     
     for i in np.arange(df.shape[0]):
         
-        lsmol2 = df.iloc[i][lsname]
-        hsmol2 = df.iloc[i][hsname]
-        ls3d,hs3d = mol3D(), mol3D()
-        ls3d.readfrommol2(lsmol2,readstring=True)
-        hs3d.readfrommol2(hsmol2,readstring=True)
-        
-        if isname != None:
-            ismol2 = df.iloc[i][isname]
-            is3d = mol3D()
-            is3d.readfrommol2(ismol2,readstring = True)
-        lslabel = ls3d.IsOct()[0]
-        hslabel = hs3d.IsOct()[0]
+        lslabel = int(geometry_state(df.iloc[i][lsname])['octahedral'])
+        hslabel = int(geometry_state(df.iloc[i][hsname])['octahedral'])
         if isname != None:
-                islabel = is3d.IsOct()[0]
+            islabel = int(geometry_state(df.iloc[i][isname])['octahedral'])
         
         if lslabel == 1:
             lso += 1
@@ -1,10 +1,69 @@
 import os
 import sys
+import time
 import numpy as np
 import pandas as pd
-from molSimplify.Classes.mol3D import mol3D
-from molSimplify.Classes.ligand import ligand_breakdown
 from molSimplify.job_manager.tools import call_bash, list_active_jobs
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'General'))
+from structure_tools import find_coordination, frame_check, newest_first #shared dissociation criteria
+
+
+#Function to incrementally parse optimized xyzs and energies from a (still running) orca out file
+def update_opt_frames(filepath):
+
+    #The byte offset reached and everything parsed so far are kept next to the out file in filepath.ckpt.npz,
+    #so every call only reads what orca has appended since the previous call
+    #A CARTESIAN COORDINATES block that is still being written is parsed again (completely) by the next call
+    #Returns symbols, frames ((nframes, natoms, 3) array, one per coordinate block) and list of energies
+
+    ckptpath = filepath + '.ckpt.npz'
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        head = f.read(256) #to detect an out file that was overwritten by a resubmission
+
+    offset, symbols, frames, energies = 0, [], [], []
+    if os.path.exists(ckptpath):
+        ckpt = np.load(ckptpath)
+        if int(ckpt['offset']) <= size and ckpt['head'].tobytes() == head:
+            offset = int(ckpt['offset'])
+            symbols = ckpt['symbols'].tolist()
+            frames = list(ckpt['frames'])
+            energies = ckpt['energies'].tolist()
+    if offset == size:
+        return symbols, np.array(frames, dtype=float).reshape(len(frames), len(symbols), 3), energies
+
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        lines = f.read().split(b'\n') #last element: line not finished yet (or empty)
+
+    i = 0
+    while i < len(lines) - 1:
+        line = lines[i]
+        if b'CARTESIAN COORDINATES (ANGSTROEM)' in line: #xyz beginning two lines later, closed by blank line
+            j = i + 2
+            rows = []
+            while j < len(lines) - 1 and len(lines[j].split()) == 4:
+                rows.append(lines[j].decode().split())
+                j += 1
+            if j >= len(lines) - 1: #block not closed yet
+                break
+            symbols = [row[0] for row in rows]
+            frames.append(np.array([row[1:] for row in rows], dtype=float))
+            offset += sum(len(l) + 1 for l in lines[i:j+1])
+            i = j + 1
+            continue
+        elif b'FINAL SINGLE POINT ENERGY' in line:
+            energies.append(float(line.split()[-1]))
+        offset += len(line) + 1
+        i += 1
+
+    frames = np.array(frames, dtype=float).reshape(len(frames), len(symbols), 3)
+    with open(ckptpath + '.tmp', 'wb') as f:
+        np.savez(f, offset=offset, head=np.frombuffer(head, dtype=np.uint8), symbols=np.array(symbols, dtype=str),
+                 frames=frames, energies=np.array(energies))
+    os.replace(ckptpath + '.tmp', ckptpath)
+
+    return symbols, frames, energies
 
 
 #Function to find optimized xyzs from orca out file
@@ -13,79 +72,153 @@ def find_opt_frames(filepath,natoms):
     if os.path.exists(filepath) == False:
         return 'Failed'
 
-    lines = open(filepath,'r').readlines()
+    symbols, frames, energies = update_opt_frames(filepath)
     xyzs = []
-    for linenum in np.arange(len(lines)):
-        if 'CARTESIAN COORDINATES (ANGSTROEM)' in lines[linenum]: #xyz beginning two lines later
-            firstline = linenum + 2
-            lastline = firstline + natoms - 1
-            xyz = []
-            for i in np.arange(firstline,lastline+1):
-                xyz.append(lines[i].lstrip())
-            xyzs.append(xyz)
-
-    if len(xyzs) > 0:
-        xyzs.pop()#n cycles: n+1 structures, so drop last one
+    for frame in frames[:-1]: #n cycles: n+1 structures, so drop last one
+        xyz = []
+        for sym, coord in zip(symbols[:natoms], frame[:natoms]):
+            xyz.append('%s %.6f %.6f %.6f\n' % (sym, coord[0], coord[1], coord[2]))
+        xyzs.append(xyz)
 
     return xyzs
 
 
-#Function to examine whether the job has reached dissociation by reading the .out file
-def check_diss_by_out(basename,threshold = 10,return_list = False):
+#Function to examine whether a job has reached dissociation given its optimization frames
+def check_diss_frames(symbols,frames,threshold = 10,return_list = False,confirm = False,stride = 1):
 
-    natoms = open(basename + '/' + basename + '.xyz','r').readlines()[0].split()[0]
-    natoms = int(natoms)
+    #frames: every coordinate block of the .out file (see update_opt_frames)
+    #Without return_list, frames are checked newest first and the scan stops at the first intact one,
+    #so a healthy job costs a single frame check; stride: check every stride-th frame first
+    #A frame is 'diss' when its denticity pattern differs from the one of the input geometry (e.g. [3,3] -> [3,2]);
+    #confirm: run ligand_breakdown on the frames found dissociated, and keep the verdict only if it agrees
+    #dependency: find_coordination, frame_check, newest_first (General/structure_tools.py)
 
-    frames = find_opt_frames(basename + '/' + basename + '.out', natoms)
+    frames = frames[:-1] #n cycles: n+1 structures, so drop last one
     if threshold > len(frames):
         return False
 
-    checks = []
-    nframes = len(frames)
-    first_frame = nframes - threshold + 1
-
-    for i in np.arange(first_frame,nframes+1):
-        file = open('temp_n.xyz', 'w')
-        file.writelines(str(natoms) + '\n')
-        file.writelines('\n')
-        file.writelines(frames[i-1])
-        file.close()
-
-        mol = mol3D()
-        mol.readfromxyz('temp_n.xyz')
-        l1,l2,l3 = ligand_breakdown(mol)
-        check = 'intact'
-        if l2 != [3,3]:
-            check = 'diss'
-        checks.append(check)
+    coordination = find_coordination(symbols, frames[0])
+    last = frames[len(frames)-threshold:]
+
+    if return_list == False:
+        for i in newest_first(threshold, stride):
+            if frame_check(symbols, last[i], coordination, confirm=confirm) == 'intact':
+                return False
+        return True
 
+    checks = [frame_check(symbols, frame, coordination, confirm=confirm) for frame in last]
     result = True
     for check in checks:
         if check == 'intact':
             result = False
 
-    if return_list:
-        return result,checks
-    else:
-        return result
-
-
-#Get name of active jobs and their idxs
-names,ids = list_active_jobs(ids=True)
+    return result,checks
 
-#The name of job should correspond to the folder that job inputs are located
-#Double check while using this script
-num_canceled = 0
-for i in np.arange(len(names)):
 
-    basename = names[i]
-    diss = check_diss_by_out(basename)
-    #print(basename, diss)
+#Function to examine whether the job has reached dissociation by reading the .out file
+def check_diss_by_out(basename,threshold = 10,return_list = False,confirm = False,stride = 1):
 
-    #If diss = True, kill the job
-    if diss == True:
-        call_bash('scancel ' + str(ids[i]))
-        print('Killed ', basename, diss)
-        num_canceled += 1
+    filepath = basename + '/' + basename + '.out'
+    if os.path.exists(filepath) == False:
+        return False
 
-print(num_canceled, ' jobs killed')
+    symbols, frames, energies = update_opt_frames(filepath)
+
+    return check_diss_frames(symbols, frames, threshold, return_list, confirm, stride)
+
+
+#Function to cancel jobs with a single scancel call
+def cancel_jobs(names,ids):
+
+    if len(ids) == 0:
+        return
+    call_bash('scancel ' + ' '.join(str(jobid) for jobid in ids))
+    for basename in names:
+        print('Killed ', basename)
+
+
+#One-shot mode: check every active job once and kill the dissociated ones
+def check_once(threshold = 10):
+
+    #The name of job should correspond to the folder that job inputs are located
+    #Double check while using this script
+    names,ids = list_active_jobs(ids=True)
+    killed_names,killed_ids = [],[]
+    for i in np.arange(len(names)):
+        if check_diss_by_out(names[i], threshold) == True:
+            killed_names.append(names[i])
+            killed_ids.append(ids[i])
+    cancel_jobs(killed_names, killed_ids)
+
+    return len(killed_ids)
+
+
+#Watchdog mode: keep watching the active jobs and kill dissociated ones as soon as they are seen
+def watch(threshold = 10, poll = 120, min_interval = 120, max_interval = 3600, max_polls = None):
+
+    #Each poll only stats the .out files: a job is re-checked only when its .out grew and its next check is due,
+    #and the dissociation check only runs when new optimization cycles were appended
+    #The interval between checks of a job follows its own pace (time per optimization cycle, within
+    #min_interval and max_interval seconds), so fast jobs are checked often and slow ones do not cost a parse per poll
+    #All jobs found dissociated during a poll are killed with one scancel call
+    #max_polls: stop after this many polls (default: run until interrupted)
+
+    jobs = {} #basename -> size and mtime of the .out, number of frames, time of the last check, next check and interval
+    canceled = set() #ids already cancelled, which may still be listed while they are being taken down
+    npolls = 0
+    while max_polls == None or npolls < max_polls:
+        names,ids = list_active_jobs(ids=True)
+        now = time.time()
+        killed_names,killed_ids = [],[]
+        for basename, jobid in zip(names, ids):
+            if jobid in canceled:
+                continue
+            filepath = basename + '/' + basename + '.out'
+            if os.path.exists(filepath) == False:
+                continue
+            stat = os.stat(filepath)
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            if basename not in jobs:
+                jobs[basename] = {'stamp': None, 'nframes': 0, 'checked': now, 'next': now, 'interval': min_interval}
+            job = jobs[basename]
+            if stamp == job['stamp'] or now < job['next']:
+                continue
+
+            job['stamp'] = stamp
+            symbols, frames, energies = update_opt_frames(filepath)
+            if len(frames) == job['nframes']: #grew within a cycle
+                continue
+            pace = (now - job['checked']) / (len(frames) - job['nframes']) #seconds per cycle
+            if job['nframes'] > 0:
+                job['interval'] = min(max(pace, min_interval), max_interval)
+            job['nframes'], job['checked'], job['next'] = len(frames), now, now + job['interval']
+
+            if check_diss_frames(symbols, frames, threshold) == True:
+                killed_names.append(basename)
+                killed_ids.append(jobid)
+
+        cancel_jobs(killed_names, killed_ids)
+        canceled.update(killed_ids)
+        for basename in list(jobs): #forget jobs that left the queue
+            if basename not in names or basename in killed_names:
+                del jobs[basename]
+
+        npolls += 1
+        if max_polls == None or npolls < max_polls:
+            time.sleep(poll)
+
+    return len(canceled)
+
+
+#Usage:
+#python dynamic_control.py: check all active jobs once
+#python dynamic_control.py watch [poll seconds]: keep watching them
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        poll = 120
+        if len(sys.argv) > 2:
+            poll = int(sys.argv[2])
+        watch(poll = poll, min_interval = poll)
+    else:
+        num_canceled = check_once()
+        print(num_canceled, ' jobs killed')
@@ -165,7 +165,11 @@ def prep_orca_input(refcode, charge, spin, spinval, mol2, machine='expanse', hfx
 #########################################################################################################################################################
 
 
-df = pd.read_csv('round2_in.csv')
+#Round tables are kept as campaign stores (General/campaign_store.py, csv_to_campaign converts old csv files)
+#Only scalar columns are loaded here; the three geometries needed are then read once for all rows
+df = load_campaign('round2_in')
+df = df.join(pd.DataFrame({column: load_geometry('round2_in', column, df.index)
+                           for column in ['round1_mol2ls', 'round1_mol2is', 'round1_mol2hs']}))
 
 indexs = df.index.values
 for idx in indexs:
@@ -173,7 +177,9 @@ for idx in indexs:
     row = df.loc[idx]
     refcode = row['refcode']
     metal,charge = row['metal'], int(row['ox_csd'])
-    mol2ls,mol2is,mol2hs = row['round1_mol2ls'], row['round1_mol2is'], row['round1_mol2hs']
+    mol2ls = row['round1_mol2ls']
+    mol2is = row['round1_mol2is']
+    mol2hs = row['round1_mol2hs']
     pp1,pp2 = row['pp1'],row['pp2']
     multiap = None
     if float(row['apnum']) != 1:
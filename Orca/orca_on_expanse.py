@@ -3,46 +3,55 @@
 
 
 import os
+import sys
+import sqlite3
 from os.path import exists,isdir
 from molSimplify.job_manager.tools import get_total_queue_usage, list_active_jobs, call_bash
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'General'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from io_tools import find_output #archived (compressed) outputs
+from output_analysis import orca_status
 
 
-def read_Orca(filepath):
+def cached_orca_status(filepath, cachepath='status_cache.sqlite'):
 
-    #Check if optimization has converged normally (not inconvergence or out of time)
-    #If so,return the final energy: energy + external potential
+    #orca_status, reused from a local SQLite cache as long as the .out file keeps its size and mtime
+    #so that each call only reads the outputs of the jobs that changed since the last one
 
+    filepath = find_output(filepath)
     if exists(filepath) == False:
-        return 'Failed_nofile'
+        return 'missing', None
 
-    lines = open(filepath,'r').readlines()
-    cond_1 = False #'Optimization run done' is found in file
-    cond_2 = False #'Orca terminated normally' is found (as second-last line)
-    cond_3 = True # 'The optimization did not converge' is found in file
+    stat = os.stat(filepath)
+    path = os.path.abspath(filepath)
+    con = sqlite3.connect(cachepath, timeout=60)
+    con.execute('CREATE TABLE IF NOT EXISTS status (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, '
+                'status TEXT, energy REAL)')
+    row = con.execute('SELECT size, mtime, status, energy FROM status WHERE path = ?', (path,)).fetchone()
+    if row != None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        con.close()
+        return row[2], row[3]
 
-    Esp,Eep = [],[]
-    for line in lines:
+    status, energy = orca_status(filepath)
+    con.execute('INSERT OR REPLACE INTO status VALUES (?, ?, ?, ?, ?)', (path, stat.st_size, stat.st_mtime_ns,
+                                                                        status, energy))
+    con.commit()
+    con.close()
 
-        if 'OPTIMIZATION RUN DONE' in line:
-            cond_1 = True
+    return status, energy
 
-        elif 'ORCA TERMINATED NORMALLY' in line:
-            cond_2 = True
 
-        elif 'The optimization did not converge' in line:
-            cond_3 = False
 
-        elif 'FINAL SINGLE POINT ENERGY' in line:
-            Esp.append(float(line.split()[-1]))
+def read_Orca(filepath):
 
-        elif 'External Potential' in line:
-            Eep.append(float(line.split()[3]))
+    #Check if optimization has converged normally (not inconvergence or out of time)
+    #If so,return the final energy: energy + external potential
 
-    if cond_1 and cond_2 and cond_3:
-        if len(Eep) != 0:#might be empty for 0nN
-            return Esp[-1] + Eep[-1]
-        else:
-            return Esp[-1]
+    status, energy = orca_status(filepath)
+    if status == 'missing':
+        return 'Failed_nofile'
+    elif status == 'converged':
+        return energy
     else:
         return 'Failed'
 
@@ -60,9 +69,8 @@ inactive_jobs = [x for x in all_jobs if x not in active_jobs]
 tosubmit_jobs = []
 for job in inactive_jobs:
     outpath = './' + job + '/' + job + '.out'
-    if exists(outpath) == False:
-        tosubmit_jobs.append(job)
-    elif type(read_Orca(outpath)) == str:
+    status, energy = cached_orca_status(outpath) #missing, failed, or killed while running
+    if status != 'converged':
         tosubmit_jobs.append(job)
 
 submission = remaining_subs
@@ -2,10 +2,16 @@ import os
 import sys
 import numpy as np
 import pandas as pd
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from molSimplify.Classes.mol3D import mol3D
 from molSimplify.Classes.atom3D import atom3D #distance
 from molSimplify.Classes.ligand import ligand_breakdown
 from molSimplify.job_manager.manager_io import read_outfile
+try:
+    from io_tools import find_output, is_archived, open_output #stand-alone scripts put General/ on sys.path
+except ImportError:
+    pass #notebooks run General/io_tools.py in the same namespace
 
 
 
@@ -15,76 +21,228 @@ from molSimplify.job_manager.manager_io import read_outfile
 
 
 
-def read_orca(filepath):
+def parse_orca_out(filepath):
 
-    #Check if optimization has converged normally (not inconvergence or out of time)
-    #If so,return the final energy: energy + external potential
+    #Read an orca .out file in a single streaming pass and return everything the analysis functions need
+    #Repeated calls on an unchanged file (same path, size and mtime) are served from memory, so
+    #read_orca, find_opt_frames, check_diss_by_out and find_spin_delocalization share one read
+    #Returns None if the file does not exist, otherwise a dict with:
+    #opt_done, terminated, opt_converged, errored: termination flags (see read_orca and orca_status)
+    #Esp, Eep: every FINAL SINGLE POINT ENERGY and External Potential value, in order of appearance
+    #Eg: final Gibbs free energy (None if not found)
+    #symbols: element symbols of the coordinate frames
+    #frames: every CARTESIAN COORDINATES (ANGSTROEM) frame as a (nframes, natoms, 3) array
+    #mulliken: every MULLIKEN ATOMIC CHARGES AND SPIN POPULATIONS block, as list of (idx, element, charge, spin)
+    #spin_sums: every 'Sum of atomic spin populations' value
+    #Archived (compressed) outputs are read transparently
+    #Tip: the record is shared between callers, do not modify it in place
+    #dependency: find_output, open_output (General/io_tools.py)
 
+    filepath = find_output(filepath)
     if os.path.exists(filepath) == False:
-        return 'Failed'
+        return None
+
+    stat = os.stat(filepath)
+    return _parse_orca_out(os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+
+
+
+@lru_cache(maxsize=32)
+def _parse_orca_out(filepath, size, mtime):
+
+    #Helper of parse_orca_out: size and mtime are only part of the cache key
+
+    record = {'opt_done': False, 'terminated': False, 'opt_converged': True, 'errored': False,
+              'Esp': [], 'Eep': [], 'Eg': None, 'symbols': [], 'frames': [],
+              'mulliken': [], 'spin_sums': []}
+
+    block = None #'xyz' or 'mulliken' while reading lines of a block
+    rows = []
+    skip = 0 #dashed line right below block titles
+    with open_output(filepath, 'r') as f:
+        for line in f:
+
+            if block != None:
+                if skip > 0:
+                    skip -= 1
+                    continue
+                if block == 'xyz':
+                    fields = line.split()
+                    if len(fields) == 4:
+                        rows.append(fields)
+                        continue
+                    record['frames'].append(rows) #blank line closes the block
+                    block = None
+                elif block == 'mulliken':
+                    if ':' in line and 'Sum of atomic' not in line:
+                        label, values = line.split(':', 1)
+                        label, values = label.split(), values.split()
+                        if len(values) == 2:
+                            rows.append((int(label[0]), ''.join(label[1:]), float(values[0]), float(values[1])))
+                        continue
+                    record['mulliken'].append(rows)
+                    block = None
+
+            if 'CARTESIAN COORDINATES (ANGSTROEM)' in line:
+                block, rows, skip = 'xyz', [], 1
+
+            elif 'MULLIKEN ATOMIC CHARGES AND SPIN POPULATIONS' in line:
+                block, rows, skip = 'mulliken', [], 1
+
+            elif 'OPTIMIZATION RUN DONE' in line:
+                record['opt_done'] = True
+
+            elif 'ORCA TERMINATED NORMALLY' in line:
+                record['terminated'] = True
+
+            elif 'The optimization did not converge' in line:
+                record['opt_converged'] = False
+
+            elif 'error termination' in line or 'aborting the run' in line:
+                record['errored'] = True
+
+            elif 'FINAL SINGLE POINT ENERGY' in line:
+                record['Esp'].append(float(line.split()[-1]))
+
+            elif 'External Potential' in line:
+                record['Eep'].append(float(line.split()[3]))
+
+            elif 'Final Gibbs free energy' in line:
+                record['Eg'] = float(line.split()[-2])
+
+            elif 'Sum of atomic spin populations' in line:
+                record['spin_sums'].append(float(line.split()[-1]))
+
+    #A block still open at the end of file is being written right now: drop it
+    frames = record['frames']
+    if len(frames) > 0:
+        natoms = len(frames[0])
+        frames = [frame for frame in frames if len(frame) == natoms]
+        record['symbols'] = [row[0] for row in frames[0]]
+        coords = np.array([[row[1:] for row in frame] for frame in frames], dtype=float)
+    else:
+        coords = np.zeros((0, 0, 3))
+    coords.setflags(write=False)
+    record['frames'] = coords
 
-    lines = open(filepath,'r').readlines()
-    cond_1 = False #'Optimization run done' is found in file
-    cond_2 = False #'Orca terminated normally' is found (as second-last line)
-    cond_3 = True # 'The optimization did not converge' is found in file
+    return record
 
-    Esp,Eep = [],[]
-    for line in lines:
 
-        if 'OPTIMIZATION RUN DONE' in line:
-            cond_1 = True
 
-        elif 'ORCA TERMINATED NORMALLY' in line:
-            cond_2 = True
+def _status_from_tail(tail, efei, whole):
 
-        elif 'The optimization did not converge' in line:
-            cond_3 = False
+    #Helper of orca_status: judge the status from the last part of an orca .out file
+    #Returns None if the tail is too short to decide (and does not already hold the whole file)
 
-        elif 'FINAL SINGLE POINT ENERGY' in line:
-            Esp.append(float(line.split()[-1]))
+    terminated = 'ORCA TERMINATED NORMALLY' in tail
+    errored = 'error termination' in tail or 'aborting the run' in tail
 
-        elif 'External Potential' in line:
-            Eep.append(float(line.split()[3]))
+    #Last energy: the last occurrence in the tail is the last one of the file
+    iesp, iep = tail.rfind('FINAL SINGLE POINT ENERGY'), tail.rfind('External Potential')
+    if iesp == -1 or (efei and iep == -1):
+        if whole == False:
+            return None
+    energy = None
+    if iesp != -1:
+        energy = float(tail[iesp:].split('\n')[0].split()[-1])
+        if iep != -1:
+            energy += float(tail[iep:].split('\n')[0].split()[3])
 
-    if cond_1 and cond_2 and cond_3:
-        if len(Eep) != 0:#might be empty for 0nN
-            return Esp[-1] + Eep[-1]
-        else:
-            return Esp[-1]
-    else:
-        return 'Failed'
+    if terminated == False and errored == False:
+        return 'running', energy
+    if errored:
+        return 'failed', energy
 
-    
+    #Terminated normally: the tail should cover the whole last optimization cycle, as the non-convergence
+    #message is printed between its energy and 'OPTIMIZATION RUN DONE'
+    idone = tail.rfind('OPTIMIZATION RUN DONE')
+    if idone == -1 or tail.rfind('FINAL SINGLE POINT ENERGY', 0, idone) == -1:
+        if whole == False:
+            return None
+    if idone != -1 and 'The optimization did not converge' not in tail:
+        return 'converged', energy
+    return 'failed', energy
 
-def read_orca_Gibbs(filepath):
 
-    #Check if optimization has converged normally (not inconvergence or out of time)
-    #If so,return the final energy: energy + external potential
 
+def orca_status(filepath, tail_bytes=65536, max_tail_bytes=4194304):
+
+    #Cheap status probe of an orca optimization that only reads the end of the .out file
+    #The buffer read backwards from the end of file is doubled until it holds everything needed
+    #Only if max_tail_bytes is not enough, the whole file is parsed with parse_orca_out
+    #Returns status, energy:
+    #status: 'converged', 'failed' (terminated without converging or by error), 'missing' (no .out file),
+    #or 'running' (no termination message yet, which is also the case for jobs killed by walltime)
+    #energy: last energy + external potential as in read_orca (None if no energy printed yet)
+    #Archived (compressed) outputs belong to finished jobs and are decompressed whole
+    #dependency: find_output, is_archived, open_output (General/io_tools.py)
+
+    filepath = find_output(filepath)
     if os.path.exists(filepath) == False:
-        return 'Unperformed'
+        return 'missing', None
+    if is_archived(filepath):
+        with open_output(filepath, 'rb') as f:
+            text = f.read().decode('utf-8', errors='replace')
+        return _status_from_tail(text, 'POTENTIALS' in text[:tail_bytes].upper(), True)
+
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        head = f.read(tail_bytes).decode('utf-8', errors='replace') #input file is echoed at the top
+        efei = 'POTENTIALS' in head.upper()
+        nbytes = tail_bytes
+        while nbytes <= max_tail_bytes:
+            f.seek(max(0, size - nbytes))
+            tail = f.read().decode('utf-8', errors='replace')
+            result = _status_from_tail(tail, efei, nbytes >= size)
+            if result != None:
+                return result
+            nbytes = nbytes * 2
+
+    #Fall back to a full scan
+    record = parse_orca_out(filepath)
+    energy = None
+    if len(record['Esp']) != 0:
+        energy = record['Esp'][-1]
+        if len(record['Eep']) != 0:
+            energy += record['Eep'][-1]
+    if record['errored']:
+        return 'failed', energy
+    if record['terminated'] == False:
+        return 'running', energy
+    if record['opt_done'] and record['opt_converged']:
+        return 'converged', energy
+    return 'failed', energy
+
 
-    lines = open(filepath,'r').readlines()
-    cond_1 = False #'Optimization run done' is found in file
-    cond_2 = False #'Orca terminated normally' is found (as second-last line)
-    cond_3 = True # 'The optimization did not converge' is found in file
 
-    for line in lines:
+def read_orca(filepath):
+
+    #Check if optimization has converged normally (not inconvergence or out of time)
+    #If so,return the final energy: energy + external potential
+    #cond_1: 'Optimization run done' is found in file
+    #cond_2: 'Orca terminated normally' is found (as second-last line)
+    #cond_3: 'The optimization did not converge' is not found in file
+    #Those are all printed at the end of file, so orca_status only has to read the tail
+
+    status, energy = orca_status(filepath)
+    if status == 'converged':
+        return energy
+    else:
+        return 'Failed'
 
-        if 'OPTIMIZATION RUN DONE' in line:
-            cond_1 = True
+    
 
-        elif 'ORCA TERMINATED NORMALLY' in line:
-            cond_2 = True
+def read_orca_Gibbs(filepath):
 
-        elif 'The optimization did not converge' in line:
-            cond_3 = False
+    #Check if optimization has converged normally (not inconvergence or out of time)
+    #If so,return the final Gibbs free energy
 
-        elif 'Final Gibbs free energy' in line:
-            Eg = float(line.split()[-2])
+    record = parse_orca_out(filepath)
+    if record == None:
+        return 'Unperformed'
 
-    if cond_1 and cond_2 and cond_3:
-        return Eg
+    if record['opt_done'] and record['terminated'] and record['opt_converged'] and record['Eg'] != None:
+        return record['Eg']
     else:
         return 'Failed'
 
@@ -117,62 +275,56 @@ def make_dir(dirname):
     
 def find_opt_frames(filepath,natoms):
 
-    if os.path.exists(filepath) == False:
+    #Return the xyz lines (without the two header lines) of every optimization cycle in an orca .out file
+
+    record = parse_orca_out(filepath)
+    if record == None:
         return 'Failed'
 
-    lines = open(filepath,'r').readlines()
+    symbols = record['symbols'][:natoms]
     xyzs = []
-    for linenum in np.arange(len(lines)):
-        if 'CARTESIAN COORDINATES (ANGSTROEM)' in lines[linenum]: #xyz beginning two lines later
-            firstline = linenum + 2
-            lastline = firstline + natoms - 1
-            xyz = []
-            for i in np.arange(firstline,lastline+1):
-                xyz.append(lines[i].lstrip())
-            xyzs.append(xyz)
-    
-    if len(xyzs) > 0:
-        xyzs.pop()#n cycles: n+1 structures, so drop last one
+    for frame in record['frames'][:-1]: #n cycles: n+1 structures, so drop last one
+        xyz = []
+        for sym, coord in zip(symbols, frame[:natoms]):
+            xyz.append('%s %.6f %.6f %.6f\n' % (sym, coord[0], coord[1], coord[2]))
+        xyzs.append(xyz)
 
     return xyzs
 
 
 
-def check_diss_by_out(basename,check_geom_shift = False, threshold = 10,return_list = False):\
+def check_diss_by_out(basename,check_geom_shift = False, threshold = 10,return_list = False, confirm = False,
+                      early_exit = True, stride = 1, cache = None):
 
     #If check_geom_shift = True:
     #Regard geometry shifting such as to tetrahedral etc also as dissociation
     #If not: only consider cases when only one ligand stay bonded as dissociation
-
-    natoms = open(basename + '/' + basename + '.xyz','r').readlines()[0].split()[0]
-    natoms = int(natoms)
-
-    frames = find_opt_frames(basename + '/' + basename + '.out', natoms)
+    #Metal, donors and ligands are identified once on the input geometry (first frame), then metal-donor distances of the
+    #last threshold frames are compared with covalent radii all at once (see General/structure_tools.py)
+    #confirm: run ligand_breakdown on the frames found dissociated, as a confirmation
+    #early_exit: check the frames newest first and stop at the first intact one (not with return_list, which needs
+    #every verdict); stride: check every stride-th frame first
+    #cache: SQLite file keeping the structural state of every frame checked (see file_states), instead of early exit
+    #Both checks go through file_states, so frames already analyzed in this session (or in cache) are not analyzed again
+    #dependency: find_coordination, dissociation_checks, all_dissociated, file_states (General/structure_tools.py)
+
+    record = parse_orca_out(basename + '/' + basename + '.out')
+    if record == None:
+        return False
+    symbols, frames = record['symbols'], record['frames'][:-1] #n cycles: n+1 structures, so drop last one
     if threshold > len(frames):
         return False
 
-    checks = []
-    nframes = len(frames)
-    first_frame = nframes - threshold + 1
-
-    for i in np.arange(first_frame,nframes+1):
-        file = open('temp_n.xyz', 'w')
-        file.writelines(str(natoms) + '\n')
-        file.writelines('\n')
-        file.writelines(frames[i-1])
-        file.close()
-
-        mol = mol3D()
-        mol.readfromxyz('temp_n.xyz')
-        l1,l2,l3 = ligand_breakdown(mol)
-        check = 'intact'
-        if check_geom_shift == False:
-            if len(l2) < 2:
-                check = 'diss'
-        else:
-            if l2 != [3,3]:
-                check = 'diss'
-        checks.append(check)
+    coordination = find_coordination(symbols, frames[0])
+    if early_exit and return_list == False and cache == None:
+        return all_dissociated(symbols, frames[len(frames)-threshold:], coordination,
+                               check_geom_shift=check_geom_shift, confirm=confirm, stride=stride,
+                               filepath=basename + '/' + basename + '.out', reference=frames[0],
+                               first=len(frames)-threshold)
+    states = file_states(basename + '/' + basename + '.out', symbols, frames[len(frames)-threshold:],
+                         reference=frames[0], first=len(frames)-threshold, cachepath=cache)
+    checks, dents = dissociation_checks(symbols, frames[len(frames)-threshold:], coordination,
+                                        check_geom_shift=check_geom_shift, confirm=confirm, states=states)
 
     result = True
     for check in checks:
@@ -186,7 +338,12 @@ def check_diss_by_out(basename,check_geom_shift = False, threshold = 10,return_l
 
 
 
-def analyze_efei_expanse(basename, thres=10, record_failed_mol2 = True):
+#Version of the results of analyze_efei_expanse kept in parse caches: bump it when their shape changes
+EFEI_EXPANSE_VERSION = 1
+
+
+
+def analyze_efei_expanse(basename, thres=10, record_failed_mol2 = True, cache = None):
 
     #Analyze an EFEI job being performed on expanse given the current configuration:
     #basename/basename.out
@@ -196,6 +353,13 @@ def analyze_efei_expanse(basename, thres=10, record_failed_mol2 = True):
     #First check: has the job succeeded. If so, record basename.xyz as mol2 of optimized molecule
     #Then check: has the molecule broken.
     #Lastly,if broken and job failed, change  energy and mol2 from 'Failed' to 'Diss'
+    #cache: parse cache file, to reuse the result as long as basename.out has not changed
+    #dependency: mol2_from_arrays (General/tools.py), cached_call (General/parse_cache.py),
+    #find_output (General/io_tools.py)
+
+    if cache != None: #stamp the file actually read, which may be archived
+        return cached_call(find_output(basename + '/' + basename + '.out'), analyze_efei_expanse,
+                           (basename, thres, record_failed_mol2), cachepath=cache, version=EFEI_EXPANSE_VERSION)
 
     if os.path.exists(basename) == False: #Helper case: if the molecule has not been analyzed
         return 'Failed','Failed','Failed'
@@ -209,20 +373,14 @@ def analyze_efei_expanse(basename, thres=10, record_failed_mol2 = True):
         energy = 'Diss'
 
     #Record mol2 (from .out)
-    natoms = open(basename + '/' + basename + '.xyz','r').readlines()[0].split()[0]
-    natoms = int(natoms)
-    frames = find_opt_frames(basename + '/' + basename + '.out',natoms)
+    record = parse_orca_out(basename + '/' + basename + '.out')
+    frames = []
+    if record != None:
+        frames = record['frames'][:-1]
     if len(frames) < 2 and energy == 'Failed':
         mol2 = 'no_progress'
     else:
-        file = open('temp_rec.xyz', 'w')
-        file.writelines(str(natoms) + '\n')
-        file.writelines('\n')
-        file.writelines(frames[-1])
-        file.close()
-        mol_rec = mol3D()
-        mol_rec.readfromxyz('temp_rec.xyz')
-        mol2 = mol_rec.writemol2('temp_rec.mol',writestring = True)
+        mol2 = mol2_from_arrays(record['symbols'], frames[-1])
 
     #Return results
     if record_failed_mol2 == False:
@@ -266,38 +424,24 @@ def find_spin_delocalization(filename,metal):
     #Check if spin if significantly delocalized away from metal
     #Return the amount of spin that is not on metal
     
-    if os.path.exists(filename) == False:
+    record = parse_orca_out(filename)
+    if record == None:
         return 'Failed'
-    
-    lines = open(filename,'r').readlines()
-    l = [] #indexes of lines that contain 'MULLIKEN ATOMIC CHARGES AND SPIN POPULATIONS'
-    ltotal = [] #indexes of lines that contain 'Sum of atomic spin populations'
-    
-    for i in np.arange(len(lines)):
-        if 'MULLIKEN ATOMIC CHARGES AND SPIN POPULATIONS' in lines[i]:
-            l.append(i)
-        elif 'Sum of atomic spin populations' in lines[i]:
-            ltotal.append(i)
-    
-    if len(l) == 0 or len(ltotal) == 0:
+    if len(record['mulliken']) == 0 or len(record['spin_sums']) == 0:
         return 'Failed'
     
-    lastflag = l[-1]
-    totalspin = lines[ltotal[0]].split()[-1]
+    totalspin = record['spin_sums'][0]
     
-    #Finding the next line that contains the name of metal after the line of last flag
-    for j in np.arange(lastflag,len(lines)):
-        if metal in lines[j]:
-            metalspin = lines[j].split()[-1]
-            break
+    #Finding the metal in the last Mulliken block
+    for idx, element, charge, spin in record['mulliken'][-1]:
+        if metal in element:
+            return totalspin - spin
             
-    spindiff = float(totalspin) - float(metalspin)
-    
-    return spindiff
+    return 'Failed'
 
 
 
- def analyze_spin(df,col1,col2,col3,name):
+def analyze_spin(df,col1,col2,col3,name):
     
     #Analyze the ground, second and highest spin of molecules recorded in dataframe
     #col1,col2,col3: column name of low, intermediate and high spin
@@ -345,69 +489,83 @@ def find_spin_delocalization(filename,metal):
     
     
     
-#########################################################################################################################################################
-#########################################################Example Scripts#################################################################################
-#########################################################################################################################################################
+#Version of the results of _harvest_job kept in parse caches: bump it when they or EFEI_EXPANSE_VERSION change
+HARVEST_JOB_VERSION = 1
 
 
 
-E_ls,E_is,E_hs,mol2_ls,mol2_is,mol2_hs,dis_ls,dis_is,dis_hs = [],[],[],[],[],[],[],[],[]
-deloc_ls,deloc_is,deloc_hs = [],[],[]
+def _harvest_job(job):
 
-indexes = df.index.values
-for i in indexes:
+    #Helper of harvest_round (run in worker processes): analyze one spin state of one complex
+    #dependency: cached_call (General/parse_cache.py), find_output (General/io_tools.py)
 
-    row = df.loc[i]
-    refcode,ap1,ap2,apnum,metal,charge = row['refcode'],row['ap1'],row['ap2'],row['apnum'],row['metal'],row['ox_csd']
-    aps = ''
-    if float(row['apnum']) != 1:
-        aps = '_' + str(ap1) + '_' + str(ap2)
-    refname = refcode + aps + '_round2f'
+    basename, metal, thres, cache = job
+    if cache != None:
+        return cached_call(find_output(basename + '/' + basename + '.out'), _harvest_job, ((basename, metal, thres, None),),
+                           cachepath=cache, version=HARVEST_JOB_VERSION)
+    energy, mol2, diss = analyze_efei_expanse(basename, thres=thres)
+    deloc = find_spin_delocalization(basename + '/' + basename + '.out', metal)
 
-    #Record all
-    Els,mol2ls,disls = analyze_efei_expanse(refname + '_LS')
-    delocls = find_spin_delocalization(refname + '_LS/' + refname + '_LS.out', metal)
-    if metal == 'Co' and charge == 2:
-        Eis,mol2is,disis,delocis = 'N/A','N/A','N/A',0
-    else:
-        Eis,mol2is,disis = analyze_efei_expanse(refname + '_IS')
-        delocis = find_spin_delocalization(refname + '_IS/' + refname + '_IS.out', metal)
-    Ehs,mol2hs,dishs = analyze_efei_expanse(refname + '_HS')
-    delochs = find_spin_delocalization(refname + '_HS/' + refname + '_HS.out', metal)
-    
-    #Resub analysis
-    #if row['round1f_Ehs'] == 'Failed':
-        #Ehs1,mol2hs1,dishs1 = analyze_efei_expanse(refname1 + '_HS')
-        #delochs1 = find_spin_delocalization(refname1 + '_HS/' + refname1 + '_HS.out', metal)
-        #df.at[i,'round1f_Ehs'] = Ehs1
-        #df.at[i,'round1f_mol2hs'] = mol2hs1
-        #if Ehs1 != 'Failed':
-            #df.at[i,'round1f_delochs'] = delochs1
-
-    #Record all recording    
-    E_ls.append(Els)
-    E_is.append(Eis)
-    E_hs.append(Ehs)
-    mol2_ls.append(mol2ls)
-    mol2_is.append(mol2is)
-    mol2_hs.append(mol2hs)
-    dis_ls.append(disls)
-    dis_is.append(disis)
-    dis_hs.append(dishs)
-    deloc_ls.append(delocls)
-    deloc_is.append(delocis)
-    deloc_hs.append(delochs)
-
-df['round2f_Els'] = E_ls
-df['round2f_Eis'] = E_is
-df['round2f_Ehs'] = E_hs
-df['round2f_mol2ls'] = mol2_ls
-df['round2f_mol2is'] = mol2_is
-df['round2f_mol2hs'] = mol2_hs
-df['round2f_diss_ls'] = dis_ls
-df['round2f_diss_is'] = dis_is
-df['round2f_diss_hs'] = dis_hs
-
-df['round2f_delocls'] = deloc_ls
-df['round2f_delocis'] = deloc_is
-df['round2f_delochs'] = deloc_hs
+    return energy, mol2, diss, deloc
+
+
+
+def harvest_round(df, roundname, spin_map=None, nprocs=None, chunksize=4, thres=10, cache=None):
+
+    #Analyze all EFEI jobs of a round (every complex and spin state) in parallel
+    #Each job is independent file parsing plus the dissociation check, so they are fanned out over a process pool
+    #Inputs:
+    #df: one row per complex, with refcode, ap1, ap2, apnum, metal and ox_csd
+    #roundname: e.g. 'round2f', job folders being refcode(_ap1_ap2)_round2f_LS/IS/HS
+    #spin_map: dict (metal, charge) -> list of spins performed; default LS and HS for Co2+, LS, IS and HS otherwise
+    #nprocs: number of worker processes (default: all cores); chunksize: jobs sent to a worker at once
+    #thres: see analyze_efei_expanse
+    #cache: parse cache file (see General/parse_cache.py); re-harvesting then only re-parses the jobs whose .out changed
+    #Output:
+    #DataFrame with df`s index and the columns roundname_Els/is/hs, _mol2ls/is/hs, _diss_ls/is/hs, _delocls/is/hs
+    #Spins not performed are recorded as 'N/A' (delocalization as 0)
+
+    if spin_map == None:
+        spin_map = {('Co', 2): ['LS', 'HS']}
+
+    jobs, slots = [], [] #slots: (row index, spin) of each job
+    for i in df.index.values:
+        row = df.loc[i]
+        aps = ''
+        if float(row['apnum']) != 1:
+            aps = '_' + str(row['ap1']) + '_' + str(row['ap2'])
+        refname = row['refcode'] + aps + '_' + roundname
+        for spin in spin_map.get((row['metal'], int(row['ox_csd'])), ['LS', 'IS', 'HS']):
+            jobs.append((refname + '_' + spin, row['metal'], thres, cache))
+            slots.append((i, spin))
+
+    with ProcessPoolExecutor(max_workers=nprocs) as pool:
+        results = list(pool.map(_harvest_job, jobs, chunksize=chunksize))
+
+    columns = {}
+    for name, default in [('_E', 'N/A'), ('_mol2', 'N/A'), ('_diss_', 'N/A'), ('_deloc', 0)]:
+        for s in ['ls', 'is', 'hs']:
+            columns[roundname + name + s] = pd.Series(default, index=df.index, dtype=object)
+    for (i, spin), (energy, mol2, diss, deloc) in zip(slots, results):
+        s = spin.lower()
+        columns[roundname + '_E' + s].at[i] = energy
+        columns[roundname + '_mol2' + s].at[i] = mol2
+        columns[roundname + '_diss_' + s].at[i] = diss
+        columns[roundname + '_deloc' + s].at[i] = deloc
+    dfround = pd.DataFrame(columns)
+
+    return dfround
+
+
+
+#########################################################################################################################################################
+#########################################################Example Scripts#################################################################################
+#########################################################################################################################################################
+
+
+
+#Record all spin states of all complexes of round 2f (df: the round table), using all cores
+#Kept as comments: harvest_round starts worker processes, which may import this module again
+#dfround = harvest_round(df, 'round2f', cache='round2f_cache.sqlite')
+#for column in dfround.columns:
+#    df[column] = dfround[column]
@@ -5,30 +5,15 @@ import pandas as pd
 from molSimplify.Classes.mol3D import mol3D
 from molSimplify.Classes.ligand import ligand_breakdown
 
- def find_nth_xyz(filepath,nth):
+
+def find_nth_xyz(filepath,nth):
 
     #Find nth structure from a scan/trajectory xyz file
     #Stores as an temp.xyz file
+    #dependency: read_xyz_frame, write_xyz_frame (General/io_tools.py)
 
-    file = open(filepath, 'r')
-    lines = file.readlines()
-
-    #Count number of atoms of molecule
-    num_atoms = lines[0].split()[0]
-    num_atoms = int(num_atoms)
-
-    #Count number of frames
-    #Each frame num lines: num_atoms + 2 header
-    num_lines = num_atoms+2
-    num_frames = len(lines)/(num_lines)
-    num_frames = int(num_frames)
-
-    #Number of lines to read: 2 + number of atoms
-    first_line = (nth - 1)  * num_lines
-    lines_output = lines[first_line:first_line+num_lines]
-    file2 = open('temp_nth.xyz', 'w')
-    file2.writelines(lines_output)
-    file2.close()
+    symbols, coords, meta = read_xyz_frame(filepath, nth-1)
+    write_xyz_frame('temp_nth.xyz', symbols, coords, meta['comment'])
 
     
 
@@ -36,47 +21,44 @@ def count_num_frames(filepath):
 
     #Count how many structures are in a scan/trajectory xyz file
     #Returned running: if xyz is being written right now
+    #dependency: index_xyz_frames (General/io_tools.py)
 
-    file = open(filepath, 'r')
-    lines = file.readlines()
-
-    #Count number of atoms of molecule
-    num_atoms = lines[0].split()[0]
-    num_atoms = int(num_atoms)
-
-    #Count number of frames
-    #Each frame num lines: num_atoms + 2 header
-    num_lines = num_atoms+2
-    num_frames = len(lines)/(num_lines)
-    if int(num_frames) == num_frames:
-        return int(num_frames)
-    else:
+    index = index_xyz_frames(filepath)
+    if index['torn']:
         return 'running'
+    else:
+        return len(index['offsets'])
 
 
     
-def check_dissociation(filepath,threshold = 5,return_list=False):
+def check_dissociation(filepath,threshold = 5,return_list=False,early_exit=True,stride=1,cache=None):
 
     #Check if we can conclude that an EFEI opt resulted in dissociation
     #If for the last num threshold jobs, the molecule has been dissociated as indicated by molSimplify
     #we can then end the jobd
     #Default threshold is 5
-
-    nframes = count_num_frames(filepath)
+    #Donors are identified on the first frame, the last frames are then checked all at once
+    #early_exit: check the frames newest first, stopping at the first intact one (not with return_list)
+    #stride: check every stride-th frame first
+    #cache: SQLite file keeping the structural state of every frame checked (see file_states), instead of early exit
+    #Both checks go through file_states, so frames already analyzed in this session (or in cache) are not analyzed again
+    #dependency: index_xyz_frames, read_xyz_frame (General/io_tools.py), find_coordination, dissociation_checks,
+    #all_dissociated, file_states (General/structure_tools.py)
+
+    index = index_xyz_frames(filepath) #last complete frames only, even while the xyz is being written
+    nframes = len(index['offsets'])
     if threshold > nframes:
         return 'Not enough frames'
 
-    frame_nums = np.arange(nframes-threshold+1, nframes+1)
-    checks = []
-    for i in frame_nums:
-        find_nth_xyz(filepath,i)
-        mol = mol3D()
-        mol.readfromxyz('temp_nth.xyz')
-        l1,l2,l3 = ligand_breakdown(mol)
-        check = 'intact'
-        if l2 != [3,3]:
-            check = 'diss'
-        checks.append(check)
+    symbols, reference, meta = read_xyz_frame(filepath, 0, index=index)
+    coordination = find_coordination(symbols, reference)
+    frames = np.array([read_xyz_frame(filepath, i, index=index)[1] for i in np.arange(nframes-threshold, nframes)])
+    if early_exit and return_list == False and cache == None:
+        return all_dissociated(symbols, frames, coordination, stride=stride, filepath=filepath, reference=reference,
+                               first=nframes-threshold)
+
+    states = file_states(filepath, symbols, frames, reference=reference, first=nframes-threshold, cachepath=cache)
+    checks, dents = dissociation_checks(symbols, frames, coordination, states=states)
 
     result = True
     for check in checks:
@@ -90,7 +72,7 @@ def check_dissociation(filepath,threshold = 5,return_list=False):
  
  
  
- def analyze_efei_expanse(basename):
+def analyze_efei_expanse(basename):
 
     #Analyze an EFEI job being performed on expanse given the current configuration:
     #basename/basename.out, scr/basename.xyz(being overwritten after optimization), basename_trj.xyz
@@ -131,26 +131,10 @@ def find_opt_xyz(optim):
     #Getting last (optimized) geometry structure from terachem input
     #Input: pathway of optim.xyz output file generated by terachem geometry optimization
     #Output: generate a temp.xyz that stores the optimized structure
+    #dependency: read_xyz_frame, write_xyz_frame (General/io_tools.py)
     
-    file = open(optim, 'r')
-    lines = file.readlines()
-    
-    #Count number of atoms of molecule
-    num_atoms = lines[0].split()[0]
-    num_atoms = int(num_atoms)
-    
-    #Count number of frames
-    #Each frame num lines: num_atoms + 2 header
-    num_lines = num_atoms+2
-    num_frames = len(lines)/(num_lines)
-    num_frames = int(num_frames)
-    
-    #Number of lines to read: 2 + number of atoms
-    first_line = (num_frames - 1)  * num_lines
-    lines_output = lines[first_line:]
-    file2 = open('temp.xyz', 'w')
-    file2.writelines(lines_output)
-    file2.close()
+    symbols, coords, meta = read_xyz_frame(optim, -1)
+    write_xyz_frame('temp.xyz', symbols, coords, meta['comment'])
     
 
     
@@ -169,23 +153,36 @@ def get_atoms_distance(mol2,idx1,idx2):
 
 
 
-def get_tera_opt_out(filepath):
+#Version of the results of get_tera_opt_out kept in parse caches: bump it when their shape changes
+TERA_OPT_OUT_VERSION = 1
+
+
+
+def get_tera_opt_out(filepath, cache=None):
     
     #Getting optimized energy and geometry structure from a terachem geom opt job
     #filepath: folder named X, containing X_jobscript, X.in, X.xyz, X.out and scr folder
-    #dependency: find_opt_xyz; read_outfile
+    #cache: parse cache file, to reuse the result as long as X.out and scr/optim.xyz have not changed
+    #read_outfile cannot read archived outputs, their final energy is taken from tera_status instead
+    #dependency: read_xyz_frame, find_output, is_archived (General/io_tools.py); mol2_from_arrays (General/tools.py);
+    #read_outfile; cached_call (General/parse_cache.py)
+
+    if cache != None:
+        files = [find_output(filepath + '/' + filepath + '.out'), find_output(filepath + '/scr/optim.xyz')]
+        return cached_call(files, get_tera_opt_out, (filepath,), cachepath=cache, version=TERA_OPT_OUT_VERSION)
 
     if os.path.exists(filepath + '/scr') == False: #if not finished
         Eout = None
         mol2out = 'Failed Convergence'
     else:
-        dict_out = read_outfile(filepath + '/' + filepath + '.out')
-        Eout = dict_out['finalenergy']
+        outpath = filepath + '/' + filepath + '.out'
+        if is_archived(find_output(outpath)):
+            Eout = tera_status(outpath)[1]
+        else:
+            Eout = read_outfile(outpath)['finalenergy']
         if Eout != None: 
-            find_opt_xyz(filepath + '/scr/optim.xyz')
-            mol3Dout = mol3D()
-            mol3Dout.readfromxyz('temp_opt.xyz')
-            mol2out = mol3Dout.writemol2('temp.mol',writestring = True)
+            symbols, coords, meta = read_xyz_frame(filepath + '/scr/optim.xyz', -1) #last (optimized) structure
+            mol2out = mol2_from_arrays(symbols, coords)
         else: #if convergence failed
             mol2out = 'Failed Convergence'
     
@@ -193,6 +190,52 @@ def get_tera_opt_out(filepath):
  
     
     
+def tera_status(filepath, tail_bytes=16384):
+
+    #Cheap status probe of a terachem geometry optimization that only reads the end of the .out file
+    #The buffer read backwards from the end of file is doubled until it holds everything needed
+    #Returns status, energy:
+    #status: 'converged', 'failed' (finished without converging, or DIE called), 'missing' (no .out file),
+    #or 'running' (no 'Job finished' yet, which is also the case for jobs killed by walltime)
+    #energy: last FINAL ENERGY printed (None if not found)
+    #Archived (compressed) outputs belong to finished jobs and are decompressed whole
+    #dependency: find_output, is_archived, open_output (General/io_tools.py)
+
+    filepath = find_output(filepath)
+    if os.path.exists(filepath) == False:
+        return 'missing', None
+
+    if is_archived(filepath):
+        with open_output(filepath, 'rb') as f:
+            tail = f.read().decode('utf-8', errors='replace')
+        ienergy = tail.rfind('FINAL ENERGY:')
+    else:
+        size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            nbytes = tail_bytes
+            while True:
+                f.seek(max(0, size - nbytes))
+                tail = f.read().decode('utf-8', errors='replace')
+                whole = nbytes >= size
+                ienergy = tail.rfind('FINAL ENERGY:')
+                if ienergy != -1 or whole:
+                    break
+                nbytes = nbytes * 2
+
+    energy = None
+    if ienergy != -1:
+        energy = float(tail[ienergy:].split('\n')[0].split()[2])
+
+    if 'DIE called' in tail:
+        return 'failed', energy
+    if 'Job finished' not in tail:
+        return 'running', energy
+    if 'Converged' in tail:
+        return 'converged', energy
+    return 'failed', energy
+
+
+
 ######################################################################################################################
 #########################################################Orca#########################################################
 ######################################################################################################################
@@ -311,38 +354,11 @@ def read_orca(filepath):
 
     #Check if optimization has converged normally (not inconvergence or out of time)
     #If so,return the final energy: energy + external potential
+    #dependency: orca_status (Orca/output_analysis.py)
 
-    if os.path.exists(filepath) == False:
-        return 'Failed'
-
-    lines = open(filepath,'r').readlines()
-    cond_1 = False #'Optimization run done' is found in file
-    cond_2 = False #'Orca terminated normally' is found (as second-last line)
-    cond_3 = True # 'The optimization did not converge' is found in file
-
-    Esp,Eep = [],[]
-    for line in lines:
-
-        if 'OPTIMIZATION RUN DONE' in line:
-            cond_1 = True
-
-        elif 'ORCA TERMINATED NORMALLY' in line:
-            cond_2 = True
-
-        elif 'The optimization did not converge' in line:
-            cond_3 = False
-
-        elif 'FINAL SINGLE POINT ENERGY' in line:
-            Esp.append(float(line.split()[-1]))
-
-        elif 'External Potential' in line:
-            Eep.append(float(line.split()[3]))
-
-    if cond_1 and cond_2 and cond_3:
-        if len(Eep) != 0:#might be empty for 0nN
-            return Esp[-1] + Eep[-1]
-        else:
-            return Esp[-1]
+    status, energy = orca_status(filepath)
+    if status == 'converged':
+        return energy
     else:
         return 'Failed'
 
@@ -373,7 +389,7 @@ def make_dir(dirname):
 
         
         
- def analyze_spin(df,col1,col2,col3,name):
+def analyze_spin(df,col1,col2,col3,name):
     
     #Analyze the ground, second and highest spin of molecules recorded in dataframe
     #col1,col2,col3: column name of low, intermediate and high spin
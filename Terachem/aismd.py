@@ -1,4 +1,5 @@
 import os
+import json
 import numpy as np
 from numpy.random import randint
 import pandas as pd
@@ -131,48 +132,55 @@ def find_distance(a1,a2):
     return sum_squares**0.5
 
 
-def analyze_aismd_traj(filename,pltname):
-    #Returns dataframe containing six bond lengths each frame, and frame number for easy plotting
-    #Also plot
+def load_traj_cache(filename):
+    #Load the coordinates of an aismd trajectory as a float32 memory-mapped (num_frames, num_atoms, 3) array
+    #The first call parses the text trajectory once and stores it next to it as filename.f32 (raw float32 coordinates)
+    #and filename.f32.json (small header: shape, element symbols, size and mtime of the trajectory)
+    #The cache is rebuilt whenever size or mtime of the trajectory change (e.g. the job is still running, or was archived)
+    #Returns symbols, coords (read-only)
+    #dependency: read_xyz_frames, find_output (General/io_tools.py)
+    
+    cachename, headername = filename + '.f32', filename + '.f32.json'
+    stat = os.stat(find_output(filename)) #the trajectory, or its archive
+    
+    header = None
+    if os.path.exists(headername) and os.path.exists(cachename):
+        with open(headername, 'r') as f:
+            header = json.load(f)
+        if header['size'] != stat.st_size or header['mtime_ns'] != stat.st_mtime_ns:
+            header = None
     
-    with open(filename, "r") as f:
-        lines = f.readlines() #97 lines per frame, 1st line number of atoms(95), 2nd line energy and frame number
-        num_frames = len(lines)/97
-        num_frames = int(num_frames) 
+    if header == None:
+        symbols, coords, metas = read_xyz_frames(filename)
+        coords.astype(np.float32).tofile(cachename + '.tmp')
+        os.replace(cachename + '.tmp', cachename)
+        header = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'shape': list(coords.shape), 'symbols': symbols}
+        with open(headername + '.tmp', 'w') as f:
+            json.dump(header, f)
+        os.replace(headername + '.tmp', headername)
     
-    d60s,d69s,d70s,d13s,d22s,d23s = [],[],[],[],[],[]
+    if header['shape'][0] == 0:
+        return header['symbols'], np.zeros(header['shape'], dtype=np.float32)
+    coords = np.memmap(cachename, dtype=np.float32, mode='r', shape=tuple(header['shape']))
+    
+    return header['symbols'], coords
+
 
-    for i in np.arange(num_frames):
-   
-        coord_1 = find_coord(lines[2 + i*97],special_case=True) # +1
-        coord_60 = find_coord(lines[61 + i*97])
-        coord_69 = find_coord(lines[70 + i*97])
-        coord_70 = find_coord(lines[71 + i*97])
-        coord_13 = find_coord(lines[14 + i*97])
-        coord_22 = find_coord(lines[23 + i*97])
-        coord_23 = find_coord(lines[24 + i*97])
+def analyze_aismd_traj(filename,pltname,savepath=None,show=True):
+    #Returns dataframe containing six bond lengths each frame, and frame number for easy plotting
+    #Also plot; savepath: write the plot there, show: show it (or close it)
+    #dependency: load_traj_cache, finish_figure (General/render.py)
     
-        d60 = find_distance(coord_1,coord_60)
-        d69 = find_distance(coord_1,coord_69)
-        d70 = find_distance(coord_1,coord_70)
-        d13 = find_distance(coord_1,coord_13)
-        d22 = find_distance(coord_1,coord_22)
-        d23 = find_distance(coord_1,coord_23)
+    symbols, coords = load_traj_cache(filename) #97 lines per frame, 1st line number of atoms(95), 2nd line energy and frame number
+    num_frames = coords.shape[0]
     
-        d60s.append(d60)
-        d69s.append(d69)
-        d70s.append(d70)
-        d13s.append(d13)
-        d22s.append(d22)
-        d23s.append(d23)
+    #Distances between atom 1 and atoms 60, 69, 70, 13, 22, 23 (counting from 1) for all frames at once
+    labels = ['d60','d69','d70','d13','d22','d23']
+    atoms = coords[:, [0,59,68,69,12,21,22], :].astype(float)
+    dists = np.linalg.norm(atoms[:, 1:, :] - atoms[:, [0], :], axis=2)
+    d60s,d69s,d70s,d13s,d22s,d23s = dists.T
     
-    df = pd.DataFrame()
-    df['d60'] = d60s
-    df['d69'] = d69s
-    df['d70'] = d70s
-    df['d13'] = d13s
-    df['d22'] = d22s
-    df['d23'] = d23s
+    df = pd.DataFrame(dists, columns=labels)
     
     distances = np.arange(0,num_frames)*0.25
     plt.figure(figsize=(8,6))
@@ -186,6 +194,6 @@ def analyze_aismd_traj(filename,pltname):
     plt.ylabel('Bond Length (A)')
     plt.legend()
     plt.title(pltname)
-    plt.show()
+    finish_figure(savepath=savepath, show=show)
     
     return df,num_frames